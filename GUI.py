@@ -1,9 +1,19 @@
-import numpy as np
-import pygame
-from solver import possible, solve
-from puzzle import get_puzzle
-
 import time
+
+# Start of the game, startup phases are timed from here so the imports below are included
+STARTED = time.perf_counter()
+
+import pygame
+from array import array
+from solver import (count_solutions, grid_view, set_solution_cache, shape_of, solve, solve_steps, SolveStats,
+                    GUESS, PLACE)
+from solution_cache import SolutionCache
+from puzzle import get_puzzle, set_puzzle_store
+from prefetch import PuzzlePrefetcher
+from logic import hint as logic_hint
+
+import argparse
+import threading
 import os
 
 pygame.init()
@@ -11,8 +21,23 @@ pygame.init()
 WIDTH, HEIGHT = 540, 600
 ROWS, COLS = 9, 9
 
+# Box size of the board, 3 for 9x9, 4 for 16x16 and 5 for 25x25
+BOX = 3
+
 B_WIDTH, B_HEIGHT = 60, 30
 
+# Maximum number of frames drawn per second
+FPS = 60
+
+# Event posted by the auto solve worker when it has finished
+SOLVED_EVENT = pygame.USEREVENT + 1
+
+# Milliseconds between cells revealed by auto solve
+REVEAL_DELAY = 50
+
+# Local puzzle store next to this file, used instead of the sudoku website when the file exists
+PUZZLE_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzles.sds')
+
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 GREY = (128, 128, 128)
@@ -20,14 +45,92 @@ RED = (207, 68, 68)
 GREEN = (117, 172, 112)
 BLUE = (27, 142, 207)
 
-DEFAULT_FONT = pygame.font.SysFont('comicsans', 40)
-SMALL_FONT = pygame.font.SysFont('comicsans', 25)
-LARGE_FONT = pygame.font.SysFont('comicsans', 60)
+FONT_NAME = 'comicsans'
+
+# File remembering where the font was found, so the system font list is only scanned on the first launch
+FONT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'sudoku', 'fonts.txt')
+
+# Solutions of the puzzles played before, so the same or an equivalent puzzle is not searched again
+SOLUTION_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'sudoku', 'solutions')
+
+# Window icon, loaded in the background while the menu is shown
+ICON = os.path.join('Images', 'sudoku_icon.jpg')
+
+
+# Timing the startup of the game, every phase is marked with the seconds since STARTED and
+# the hooks are called with the timer once the first frame of the menu is on screen
+class StartupTimer:
+
+    def __init__(self, start):
+        self.start = start
+        self.marks = []
+        self.hooks = []
+        self.done = False
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.start))
+
+    # Marking the first menu frame and calling the hooks, only the first call does anything
+    def first_frame(self):
+        if self.done:
+            return
+        self.done = True
+        self.mark('first menu frame')
+        for hook in self.hooks:
+            hook(self)
+
+    def report(self):
+        return "Startup: " + ", ".join("{} {:.0f} ms".format(name, t * 1000) for name, t in self.marks)
 
-BORDER_FONT = pygame.font.SysFont('comicsans', 82)
 
-WINNER_FONT = pygame.font.SysFont('comicsans', 60)
-LOSE_FONT = pygame.font.SysFont('comicsans', 60)
+STARTUP = StartupTimer(STARTED)
+STARTUP.mark('imports')
+
+_font_paths = None
+
+
+# Path of the system font with the given name, '' for pygame's default font when it is not installed.
+# Paths are read from FONT_CACHE, the system fonts are only scanned for names not in it
+def font_path(name):
+    global _font_paths
+
+    if _font_paths is None:
+        _font_paths = {}
+        try:
+            with open(FONT_CACHE) as f:
+                for line in f:
+                    key, _, path = line.rstrip('\n').partition('\t')
+                    if not path or os.path.exists(path):
+                        _font_paths[key] = path
+        except OSError:
+            pass
+
+    if name not in _font_paths:
+        _font_paths[name] = pygame.font.match_font(name) or ''
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE), exist_ok=True)
+            with open(FONT_CACHE, 'w') as f:
+                f.writelines('{}\t{}\n'.format(key, path) for key, path in _font_paths.items())
+        except OSError:
+            pass
+    return _font_paths[name]
+
+
+# Font of the given size, the same font pygame.font.SysFont gives but without scanning the system fonts
+def load_font(size, name=FONT_NAME):
+    return pygame.font.Font(font_path(name) or None, size)
+
+
+DEFAULT_FONT = load_font(40)
+SMALL_FONT = load_font(25)
+LARGE_FONT = load_font(60)
+
+BORDER_FONT = load_font(82)
+
+WINNER_FONT = load_font(60)
+LOSE_FONT = load_font(60)
+
+STARTUP.mark('fonts')
 
 # Border Rendering
 _circle_cache = {}
@@ -54,8 +157,46 @@ def _circlepoints(r):
     return points
 
 
-# Rendering Border
+# Rendered text, button and outline surfaces, built the first time they are drawn and then only blitted
+_text_cache = {}
+_button_cache = {}
+_outline_cache = {}
+
+
+# Returning the surface of text rendered in font and color, rendering it only once
+def text_surface(font, text, color=BLACK):
+    key = (font, text, color)
+    surf = _text_cache.get(key)
+    if surf is None:
+        surf = _text_cache[key] = font.render(text, True, color)
+    return surf
+
+
+# Returning a button of the given size drawn on background, filled when hovered and outlined otherwise,
+# with its label centered
+def button_surface(label, color, size, hover, background=WHITE, font=None):
+    font = font or SMALL_FONT
+    key = (label, color, size, hover, background, font)
+    surf = _button_cache.get(key)
+    if surf is None:
+        surf = _button_cache[key] = pygame.Surface(size)
+        surf.fill(background)
+        pygame.draw.rect(surf, color, surf.get_rect(), 0 if hover else 3)
+
+        text = text_surface(font, label)
+        surf.blit(text, ((size[0] - text.get_width()) // 2, (size[1] - text.get_height()) // 2))
+    return surf
+
+
+# Rendering Border, each text, font and colors combination is rendered once
 def render(text, font, gfcolor=BLACK, ocolor=WHITE, opx=2):
+    key = (text, font, gfcolor, ocolor, opx)
+    if key not in _outline_cache:
+        _outline_cache[key] = _render_outline(text, font, gfcolor, ocolor, opx)
+    return _outline_cache[key]
+
+
+def _render_outline(text, font, gfcolor, ocolor, opx):
     textsurface = font.render(text, True, gfcolor).convert_alpha()
     w = textsurface.get_width() + 2 * opx
     h = font.get_height()
@@ -74,64 +215,253 @@ def render(text, font, gfcolor=BLACK, ocolor=WHITE, opx=2):
     return surf
 
 
-# Board Class representing sudoku board containing list of object of class Cubes as cells
+# Font for the digits of a board with the given number of rows, smaller fonts for larger boards
+def cell_font(size):
+    if size == 9:
+        return DEFAULT_FONT
+    return load_font(max(12, 40 * 9 // size))
+
+
+# Board Class representing sudoku board, with Cube objects made on demand as views of its cells.
+# The state of every cell is kept in flat byte arrays indexed by x * size + y (values, temporary values,
+# border flags and cells to redraw), so many boards can be kept in memory at once.
 class Board:
 
-    def __init__(self, rows, cols, width, height, diff):
+    def __init__(self, rows, cols, width, height, diff, prefetcher=None):
         self.rows = rows
         self.cols = cols
 
+        # Number of digits and box size, 9 and 3 for the classic board
+        self.size = rows
+        self.box = shape_of(rows).box
+        self.font = cell_font(rows)
+
         self.width = width
         self.height = height
 
         self.diff = diff
 
-        # Calling get_puzzle function to extract puzzle from sudoku website according to difficulty
-        self.grid = get_puzzle(diff)
+        # Taking a ready puzzle from the prefetcher, or calling get_puzzle function to extract puzzle
+        # from sudoku website according to difficulty
+        if prefetcher is not None:
+            puzzle = prefetcher.get(diff)
+        else:
+            puzzle = get_puzzle(diff, box=self.box)
+
+        # Givens of the puzzle and the state of every cell
+        cells = self.rows * self.cols
+        self.givens = bytearray(n for row in puzzle for n in row)
+        self.values = bytearray(cells)
+        self.temps = bytearray(cells)
+        self.flags = bytearray(cells)
+        self.dirty = bytearray(b'\x01' * cells)
+
+        # Scratch copy of the values that solves work on, self.model reads it as rows once it is first used
+        self.model_values = bytearray(cells)
+        self.model = None
 
-        # Initializing list of Cube objects with the grid values
-        self.cubes = [[Cube(self.grid[i][j], i, j, self.width, self.height) for j in range(self.cols)] for i in
-                      range(self.rows)]
+        # Per digit counts (digit n of row x at x * (size + 1) + n) and bitmasks of the values placed
+        # in each row, column and box, kept up to date by Cube.set so checks never rescan the grid
+        self.row_count = bytearray(self.rows * (self.size + 1))
+        self.col_count = bytearray(self.cols * (self.size + 1))
+        self.box_count = bytearray(self.size * (self.size + 1))
+        self.row_mask = array('L', bytes(self.rows * array('L').itemsize))
+        self.col_mask = array('L', bytes(self.cols * array('L').itemsize))
+        self.box_mask = array('L', bytes(self.size * array('L').itemsize))
+        self.filled = 0
+
+        # Setting the given values
+        for i in range(cells):
+            if self.givens[i]:
+                self.cube(i // self.cols, i % self.cols).set(self.givens[i])
 
-        self.model = None
         self.selected = None
-        self.auto = False
 
-    # Updating model to current grid values
+        # White window sized surface with the grid lines already drawn
+        self.background = None
+
+        # Solution of the givens, computed once in the background when the puzzle is loaded
+        self.solution = None
+        self.unique = False
+        self._solution_key = None
+        self._solution_thread = None
+
+        # Statistics of the last solve done for this board
+        self.last_stats = None
+
+        self.cache_solution()
+
+    # Starting a background solve of the givens, only repeated if the givens have changed since the last one
+    def cache_solution(self):
+        key = bytes(self.givens)
+        if key == self._solution_key:
+            return
+
+        self._solution_key = key
+        self.solution = None
+        self.unique = False
+
+        givens = grid_view(bytearray(key), self.size)
+        self._solution_thread = threading.Thread(target=self._solve_givens, args=(key, givens), daemon=True)
+        self._solution_thread.start()
+
+    # Counting the solutions of the givens up to two, the count fills in the first solution it finds
+    # so the puzzle is only searched once, its statistics are kept as those of the last solve
+    def _solve_givens(self, key, givens):
+        stats = SolveStats()
+        count = count_solutions(givens, 2, givens, stats)
+        self.last_stats = stats
+        if count and key == self._solution_key:
+            self.unique = count == 1
+            self.solution = givens
+
+    # Returning the cached solution, waiting for the background solve if it is still running
+    def get_solution(self):
+        self.cache_solution()
+        if self._solution_thread is not None:
+            self._solution_thread.join()
+        return self.solution
+
+    # Solving a grid for this board, keeping the statistics of the solve
+    def solve_model(self, grid):
+        stats = SolveStats()
+        solved = solve(grid, stats=stats)
+        self.last_stats = stats
+        return solved
+
+    # Updating model to current grid values, copying them into the model's buffer
     def update_model(self):
-        self.model = [[self.cubes[i][j].value for j in range(self.cols)] for i in range(self.rows)]
+        self.model_values[:] = self.values
+        if self.model is None:
+            self.model = grid_view(self.model_values, self.size)
+
+    # View of the cell at row x and column y
+    def cube(self, x, y):
+        return Cube(self, x, y)
+
+    # Current values as a grid over a buffer of its own, for solving in another thread
+    def snapshot(self):
+        return grid_view(bytearray(self.values), self.size)
+
+    # Updating occupancy of a cell's row, column and box when its value changes from old to new
+    def update_occupancy(self, x, y, old, new):
+        size, box = self.size, self.box
+        b = (x // box) * box + y // box
+        xs, ys, bs = x * (size + 1), y * (size + 1), b * (size + 1)
+
+        if old:
+            bit = ~(1 << old)
+            self.filled -= 1
+            self.row_count[xs + old] -= 1
+            self.col_count[ys + old] -= 1
+            self.box_count[bs + old] -= 1
+            if not self.row_count[xs + old]:
+                self.row_mask[x] &= bit
+            if not self.col_count[ys + old]:
+                self.col_mask[y] &= bit
+            if not self.box_count[bs + old]:
+                self.box_mask[b] &= bit
+
+        if new:
+            bit = 1 << new
+            self.filled += 1
+            self.row_count[xs + new] += 1
+            self.col_count[ys + new] += 1
+            self.box_count[bs + new] += 1
+            self.row_mask[x] |= bit
+            self.col_mask[y] |= bit
+            self.box_mask[b] |= bit
+
+        # Pencilled digits in the same row, column or box may have started or stopped clashing
+        x0, y0 = (x // box) * box, (y // box) * box
+        for i in range(size):
+            for cell in (x * size + i, i * size + y, (x0 + i // box) * size + y0 + i % box):
+                if self.temps[cell]:
+                    self.dirty[cell] = 1
+
+    # Bitmask of the digits already used in the row, column and box of a cell
+    def used_digits(self, x, y):
+        return self.row_mask[x] | self.col_mask[y] | self.box_mask[(x // self.box) * self.box + y // self.box]
+
+    # Digits that can still be placed in an empty cell
+    def candidates(self, x, y):
+        if self.values[x * self.cols + y]:
+            return []
+        used = self.used_digits(x, y)
+        return [n for n in range(1, self.size + 1) if not used & (1 << n)]
+
+    # Checking if digit n does not clash with any value in the row, column or box of an empty cell
+    def is_valid(self, x, y, n):
+        return self.values[x * self.cols + y] == 0 and not self.used_digits(x, y) & (1 << n)
 
     # Inserting value to the selected cell
     def insert(self, val):
         x, y = self.selected
-
-        if self.cubes[x][y].value == 0:
-            self.cubes[x][y].set(val)
-            self.update_model()
-
-            if possible(self.model, x, y, val) and solve(self.model):
-                self.cubes[x][y].flag = 2
+        cube = self.cube(x, y)
+
+        if cube.value == 0:
+            correct = False
+
+            if self.is_valid(x, y, val):
+                solution = self.get_solution()
+
+                # Checking a digit is a lookup in the cached solution
+                if solution is not None and solution[x][y] == val:
+                    cube.set(val)
+                    cube.set_flag(2)
+                    return True
+
+                # Otherwise solving again, unless the solution is known to be the only one,
+                # the puzzle may have another solution containing this digit
+                if not self.unique:
+                    cube.set(val)
+                    self.update_model()
+                    correct = self.solve_model(self.model)
+
+            if correct:
+                self.solution = grid_view(bytearray(self.model_values), self.size)
+                cube.set_flag(2)
                 return True
             else:
-                self.cubes[x][y].set(0)
-                self.cubes[x][y].set_temp(0)
-                self.cubes[x][y].flag = 1
-                self.update_model()
+                cube.set(0)
+                cube.set_temp(0)
+                cube.set_flag(1)
                 return False
 
+    # Next digit to place as (x, y, value). The logic solver finds it with human techniques when it can
+    # (9x9 boards only), otherwise the first step of a traced solve of the current board is used.
+    # A forced digit is used as is, if the solve starts with a guess the cached solution gives the value instead.
+    def hint(self):
+        self.update_model()
+
+        found = logic_hint(self.model) if self.size == 9 else None
+        if found is not None:
+            x, y, n, technique = found
+            print("Hint: {} ({})".format(n, technique.replace('_', ' ')))
+            return x, y, n
+
+        for step in solve_steps(self.model):
+            if step.kind == PLACE:
+                return step.cell + (step.digit,)
+
+            if step.kind == GUESS:
+                solution = self.get_solution()
+                if solution is not None:
+                    x, y = step.cell
+                    return x, y, solution[x][y]
+            return None
+
     # Setting temporary value to the selected cell
     def temp(self, val):
         x, y = self.selected
-        self.cubes[x][y].set_temp(val)
-
-    # Draw the sudoku grid and all the values and temporary values of each cells
-    def draw_window(self, window):
+        self.cube(x, y).set_temp(val)
 
-        # Draw Grid Lines
-        gap = self.width / 9
+    # Draw Grid Lines
+    def draw_grid(self, window):
+        gap = self.width / self.size
 
         for i in range(self.rows + 1):
-            if i % 3 == 0 and i != 0:
+            if i % self.box == 0 and i != 0:
                 line_width = 4
             else:
                 line_width = 1
@@ -139,40 +469,68 @@ class Board:
             pygame.draw.line(window, BLACK, (0, i * gap), (self.width, i * gap), line_width)
             pygame.draw.line(window, BLACK, (i * gap, 0), (i * gap, self.height), line_width)
 
+    # Returning the background layer for the window, drawing the grid on it once
+    def get_background(self, window):
+        if self.background is None or self.background.get_size() != window.get_size():
+            self.background = pygame.Surface(window.get_size()).convert()
+            self.background.fill(WHITE)
+            self.draw_grid(self.background)
+        return self.background
+
+    # Draw the sudoku grid and all the values and temporary values of each cells
+    def draw_window(self, window):
+        window.blit(self.get_background(window), (0, 0))
+
         # Draw Cubes
         for j in range(self.cols):
             for i in range(self.rows):
-                self.cubes[i][j].draw(window)
-                if self.auto:
-                    pygame.time.delay(50)
-                    pygame.display.update()
-
-        self.auto = False
+                self.cube(i, j).draw(window)
+        self.dirty[:] = bytes(len(self.dirty))
+
+    # Redrawing only the cells that changed since they were last drawn, returns the areas redrawn
+    def draw_dirty(self, window):
+        rects = []
+
+        i = self.dirty.find(1)
+        while i != -1:
+            cube = self.cube(i // self.cols, i % self.cols)
+            rect = cube.rect()
+            window.set_clip(rect)
+            window.blit(self.get_background(window), rect, rect)
+            cube.draw(window)
+            self.dirty[i] = 0
+            rects.append(rect)
+            i = self.dirty.find(1, i + 1)
+
+        window.set_clip(None)
+        return rects
 
     # Selecting a cell by given coordinates
     def select(self, x, y):
 
         # Reset all other
-        for i in range(self.rows):
-            for j in range(self.cols):
-                self.cubes[i][j].selected = False
-                self.cubes[i][j].flag = 0
-
-        self.cubes[x][y].selected = True
-        print((x, y), self.cubes[x][y].value)
+        if self.selected is not None:
+            self.cube(*self.selected).dirty = True
+        for i, flag in enumerate(self.flags):
+            if flag:
+                self.flags[i] = 0
+                self.dirty[i] = 1
+
+        self.cube(x, y).dirty = True
+        print((x, y), self.cube(x, y).value)
         self.selected = (x, y)
 
     # Clearing temporary values from the selected cell
     def clear(self):
-        x, y = self.selected
-        if self.cubes[x][y].value == 0:
-            self.cubes[x][y].set_temp(0)
+        cube = self.cube(*self.selected)
+        if cube.value == 0:
+            cube.set_temp(0)
 
     # Returning coordinates of a cell according to the the clicked position of mouse
     def click(self, pos):
 
         if pos[0] < self.width and pos[1] < self.height:
-            gap = self.width / 9
+            gap = self.width / self.size
 
             y = int(pos[0] / gap)
             x = int(pos[1] / gap)
@@ -183,114 +541,205 @@ class Board:
 
     # Checking if puzzle is finished
     def is_finished(self):
-        for i in range(self.rows):
-            for j in range(self.cols):
-                if self.cubes[i][j].value == 0:
-                    return False
-        return True
+        return self.filled == self.rows * self.cols
 
 
-# Cube class for representing each cell
+# Cube class for representing each cell, a view of one cell of its board's state arrays
 class Cube:
-    ROWS = 9
-    COLS = 9
+    __slots__ = ('board', 'x', 'y', 'index')
 
-    def __init__(self, value, x, y, width, height):
-        self.value = value
-        self.temp = 0
+    def __init__(self, board, x, y):
+        self.board = board
 
         self.x = x
         self.y = y
 
-        self.width = width
-        self.height = height
+        # Position of the cell in the board's state arrays
+        self.index = x * board.cols + y
 
-        self.selected = False
-        self.flag = 0
+    @property
+    def value(self):
+        return self.board.values[self.index]
 
-    # Draw the values inside the cell and color of border according the type of selection
-    def draw(self, window):
+    @property
+    def temp(self):
+        return self.board.temps[self.index]
+
+    @property
+    def flag(self):
+        return self.board.flags[self.index]
 
-        gap = self.width / 9
+    @property
+    def selected(self):
+        return self.board.selected == (self.x, self.y)
 
-        x1 = self.x * gap
-        y1 = self.y * gap
+    # Set when the cell has to be drawn again
+    @property
+    def dirty(self):
+        return bool(self.board.dirty[self.index])
 
-        # Drawing main value if valid or the temporary value if set and main value is 0
-        if self.value == 0 and self.temp != 0:
-            text = DEFAULT_FONT.render(str(self.temp), True, GREY)
-            window.blit(text, (y1 + 5, x1 + 5))
-        elif self.value != 0:
-            text = DEFAULT_FONT.render(str(self.value), True, BLACK)
-            window.blit(text, (y1 + (gap - text.get_width()) / 2, x1 + (gap - text.get_height()) / 2))
+    @dirty.setter
+    def dirty(self, dirty):
+        self.board.dirty[self.index] = dirty
+
+    # Area of the window covered by the cell, with its edges rounded to whole pixels so the cells of boards
+    # with a fractional cell size tile the board without gaps or overlaps
+    def rect(self):
+        gap = self.board.width / self.board.size
+        left, top = round(self.y * gap), round(self.x * gap)
+        return pygame.Rect(left, top, round((self.y + 1) * gap) - left, round((self.x + 1) * gap) - top)
+
+    # Draw the values inside the cell and color of border according the type of selection,
+    # everything is drawn inside rect() so redrawing that area erases all of it
+    def draw(self, window):
+
+        board = self.board
+        rect = self.rect()
+        value, temp = self.value, self.temp
+
+        # Drawing main value if valid or the temporary value if set and main value is 0,
+        # temporary values clashing with their row, column or box are shown in red
+        if value == 0 and temp != 0:
+            color = GREY
+            if not board.is_valid(self.x, self.y, temp):
+                color = RED
+            text = text_surface(board.font, str(temp), color)
+            window.blit(text, (rect.x + rect.width // 12, rect.y + rect.height // 12))
+        elif value != 0:
+            text = text_surface(board.font, str(value), BLACK)
+            window.blit(text, (rect.x + (rect.width - text.get_width()) // 2,
+                               rect.y + (rect.height - text.get_height()) // 2))
 
         # Draw the color of border of cell according to flag value
         if self.selected:
             if self.flag == 1:
-                pygame.draw.rect(window, RED, (y1, x1, gap, gap), 3)
+                pygame.draw.rect(window, RED, rect, 3)
             elif self.flag == 2:
-                pygame.draw.rect(window, GREEN, (y1, x1, gap, gap), 3)
+                pygame.draw.rect(window, GREEN, rect, 3)
             else:
-                pygame.draw.rect(window, BLUE, (y1, x1, gap, gap), 3)
+                pygame.draw.rect(window, BLUE, rect, 3)
 
     # Setting main value of cell
     def set(self, val):
-        self.value = val
+        board = self.board
+        if val != board.values[self.index]:
+            board.update_occupancy(self.x, self.y, board.values[self.index], val)
+            board.values[self.index] = val
+        board.dirty[self.index] = 1
 
     # Setting temporary value of cell
     def set_temp(self, val):
-        self.temp = val
+        if val != self.board.temps[self.index]:
+            self.board.temps[self.index] = val
+            self.board.dirty[self.index] = 1
+
+    # Setting the border color flag of cell
+    def set_flag(self, flag):
+        if flag != self.board.flags[self.index]:
+            self.board.flags[self.index] = flag
+            self.board.dirty[self.index] = 1
 
 
 # Redrawing window at every iteration
 def redraw_window(window, board, time, strikes, diff):
-    window.fill(WHITE)
+    # Draw grid and board
+    board.draw_window(window)
+
+    draw_hud(window, board, time, strikes, diff)
+
 
+# Drawing time, buttons, strikes and difficulty below the board
+def draw_hud(window, board, time, strikes, diff):
     # Draw time
     text = DEFAULT_FONT.render("Time: " + format_time(time), True, BLACK)
     window.blit(text, (WIDTH - text.get_width() - 20, HEIGHT - text.get_height() - 15))
 
     # Draw buttons
     gap = board.width // 9
-
-    mouse = pygame.mouse.get_pos()
-    click = pygame.mouse.get_pressed()
-
     x, y = 3 * gap, HEIGHT - B_HEIGHT - 15
+    hover = button_hover(board)
 
-    b1 = pygame.Rect(x, y, B_WIDTH, B_HEIGHT)
-    b2 = pygame.Rect(x + 2 * gap, y, B_WIDTH, B_HEIGHT)
-
-    if y < mouse[1] < y + B_HEIGHT and x < mouse[0] < x + B_WIDTH:
-        pygame.draw.rect(window, GREEN, b1)
-    else:
-        pygame.draw.rect(window, GREEN, b1, 3)
-
-    if y < mouse[1] < y + B_HEIGHT and x + 2 * gap < mouse[0] < x + 2 * gap + B_WIDTH:
-        pygame.draw.rect(window, RED, b2)
-    else:
-        pygame.draw.rect(window, RED, b2, 3)
-
-    # Button Texts
-    text1 = SMALL_FONT.render("Solve", True, BLACK)
-    text2 = SMALL_FONT.render("Quit", True, BLACK)
-
-    window.blit(text1, (x + (B_WIDTH - text1.get_width()) // 2, y + (B_HEIGHT - text1.get_height()) // 2))
-    window.blit(text2, (x + 2 * gap + (B_WIDTH - text2.get_width()) // 2, y + (B_HEIGHT - text2.get_height()) // 2))
+    window.blit(button_surface("Solve", GREEN, (B_WIDTH, B_HEIGHT), hover[0]), (x, y))
+    window.blit(button_surface("Quit", RED, (B_WIDTH, B_HEIGHT), hover[1]), (x + 2 * gap, y))
 
     # Draw Strikes
     if strikes == 1:
-        text = LARGE_FONT.render("X", True, RED)
+        text = text_surface(LARGE_FONT, "X", RED)
         window.blit(text, (20, HEIGHT - text.get_height() - 10))
     elif strikes == 2:
-        text = LARGE_FONT.render("O", True, GREEN)
+        text = text_surface(LARGE_FONT, "O", GREEN)
         window.blit(text, (20, HEIGHT - text.get_height() - 10))
 
-    text3 = SMALL_FONT.render("[Difficulty: {}]".format(diff), True, BLACK)
+    text3 = text_surface(SMALL_FONT, "[Difficulty: {}]".format(diff))
     window.blit(text3, (gap, HEIGHT - text.get_height() - 10))
 
-    # Draw grid and board
-    board.draw_window(window)
+
+# Mouse hover state of the Solve and Quit buttons
+def button_hover(board):
+    gap = board.width // 9
+    mouse = pygame.mouse.get_pos()
+    x, y = 3 * gap, HEIGHT - B_HEIGHT - 15
+
+    return (y < mouse[1] < y + B_HEIGHT and x < mouse[0] < x + B_WIDTH,
+            y < mouse[1] < y + B_HEIGHT and x + 2 * gap < mouse[0] < x + 2 * gap + B_WIDTH)
+
+
+# Renderer redrawing only the cells and parts of the bottom panel that changed since the last frame,
+# so the display is updated with a list of small rects instead of the whole window
+class DirtyRenderer:
+
+    def __init__(self):
+        self.full = True
+        self.hud = {}
+
+    # Forcing a full redraw on the next frame, after a resize or when something was drawn over the window
+    def invalidate(self):
+        self.full = True
+
+    # Areas of the bottom panel with the state that decides how each is drawn
+    def hud_regions(self, board, time, strikes, diff):
+        gap = board.width // 9
+        top = board.height
+        panel = HEIGHT - top
+
+        hover = button_hover(board)
+        timer_width = DEFAULT_FONT.size("Time: " + format_time(time))[0] + 20
+
+        return {
+            'status': (pygame.Rect(0, top, 3 * gap, panel), (strikes, diff)),
+            'solve': (pygame.Rect(3 * gap, top, 2 * gap, panel), hover[0]),
+            'quit': (pygame.Rect(5 * gap, top, 2 * gap, panel), hover[1]),
+            'time': (pygame.Rect(WIDTH - timer_width, top, timer_width, panel), time),
+        }
+
+    # Drawing the frame, returns the list of rects to pass to pygame.display.update
+    def draw(self, window, board, time, strikes, diff):
+        regions = self.hud_regions(board, time, strikes, diff)
+
+        if self.full:
+            redraw_window(window, board, time, strikes, diff)
+            self.hud = {name: region for name, region in regions.items()}
+            self.full = False
+            return [window.get_rect()]
+
+        rects = []
+        for name, (rect, state) in regions.items():
+            last = self.hud.get(name)
+            if last is not None and last[1] == state:
+                continue
+
+            # The timer text can shrink, so the area it used last time is cleared as well
+            if last is not None:
+                rect = rect.union(last[0])
+
+            window.set_clip(rect)
+            window.blit(board.get_background(window), rect, rect)
+            draw_hud(window, board, time, strikes, diff)
+            rects.append(rect)
+            self.hud[name] = (rect, state)
+
+        window.set_clip(None)
+        return rects + board.draw_dirty(window)
 
 
 # Converting Current Time for each iteration to string data
@@ -303,18 +752,70 @@ def format_time(secs):
     return t
 
 
-# Auto solver function
-def auto_solve(window, board):
-    board.update_model()
-
-    if solve(board.model):
-        for i in range(board.rows):
-            for j in range(board.cols):
-                board.cubes[i][j].value = board.model[i][j]
-                board.auto = True
-        return True
-    else:
-        return False
+# Auto solver, solving in a worker thread and then revealing the solution one cell per REVEAL_DELAY
+# from the main loop, so the window keeps responding and the user can cancel
+class AutoSolver:
+
+    def __init__(self, board):
+        self.board = board
+
+        self.thread = None
+        self.cancelled = threading.Event()
+
+        # Cells still to reveal with their values, and when the next one is due
+        self.pending = []
+        self.revealed = []
+        self.next_reveal = 0
+
+    # Checking if a solve or reveal is in progress
+    def busy(self):
+        return (self.thread is not None and self.thread.is_alive()) or bool(self.pending)
+
+    # Starting the worker, it posts SOLVED_EVENT with the solution, or None if the puzzle cannot be solved
+    def start(self):
+        if self.busy():
+            return
+
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._solve, args=(self.board.snapshot(), self.cancelled), daemon=True)
+        self.thread.start()
+
+    def _solve(self, model, cancelled):
+        # Every accepted digit agrees with the cached solution, so it can be used directly
+        solution = self.board.get_solution()
+        if solution is None and self.board.solve_model(model):
+            solution = model
+
+        if not cancelled.is_set():
+            pygame.event.post(pygame.event.Event(SOLVED_EVENT, solution=solution, cancelled=cancelled))
+
+    # Queueing the empty cells for the reveal animation, column by column
+    def reveal(self, solution):
+        board = self.board
+        self.pending = [(i, j, solution[i][j]) for j in range(board.cols) for i in range(board.rows)
+                        if board.cube(i, j).value == 0]
+        self.pending.reverse()
+        self.revealed = []
+        self.next_reveal = pygame.time.get_ticks()
+
+    # Revealing every cell that is due, called once per frame
+    def update(self):
+        now = pygame.time.get_ticks()
+        while self.pending and now >= self.next_reveal:
+            i, j, value = self.pending.pop()
+            cube = self.board.cube(i, j)
+            if cube.value == 0:
+                cube.set(value)
+                self.revealed.append(cube)
+            self.next_reveal += REVEAL_DELAY
+
+    # Stopping the solve or reveal, cells revealed so far are emptied again
+    def cancel(self):
+        self.cancelled.set()
+        self.pending = []
+        for cube in self.revealed:
+            cube.set(0)
+        self.revealed = []
 
 
 # Winner Text
@@ -355,8 +856,37 @@ def draw_lose(window, text, color=RED):
     pygame.time.delay(1400)
 
 
-# Menu for selecting difficulty
-def menu(window):
+# Loading the window icon in a background thread, so the menu is drawn without waiting for it
+class IconLoader:
+
+    def __init__(self, path=ICON):
+        self.path = path
+        self.image = None
+        self._thread = threading.Thread(target=self._load, name="icon-load", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # The default icon is kept when the image can't be loaded
+    def _load(self):
+        try:
+            self.image = pygame.image.load(self.path)
+        except (pygame.error, OSError):
+            pass
+
+    # Setting the icon once it has loaded, returns True when there is nothing left to do
+    def apply(self):
+        if self._thread.is_alive():
+            return False
+        if self.image is not None:
+            pygame.display.set_icon(self.image)
+            self.image = None
+        return True
+
+
+# Menu for selecting difficulty, the icon is set from the loader when it is ready
+def menu(window, icon=None, fps=FPS):
     run = True
     clock = pygame.time.Clock()
 
@@ -421,70 +951,76 @@ def menu(window):
         x1, x2, x3, x4 = gap * 1, gap * 3, gap * 5, gap * 7
         y = (HEIGHT - b_HEIGHT) // 2
 
-        # Draw buttons
-        b1 = pygame.Rect(x1, y, b_WIDTH, b_HEIGHT)
-        b2 = pygame.Rect(x2, y, b_WIDTH, b_HEIGHT)
-        b3 = pygame.Rect(x3, y, b_WIDTH, b_HEIGHT)
-        b4 = pygame.Rect(x4, y, b_WIDTH, b_HEIGHT)
-
-        # Button colors
-        if y < mouse[1] < y + b_HEIGHT and x1 < mouse[0] < x1 + b_WIDTH:
-            pygame.draw.rect(window, (117, 172, 112), b1)
-        else:
-            pygame.draw.rect(window, (117, 172, 112), b1, 3)
-
-        if y < mouse[1] < y + b_HEIGHT and x2 < mouse[0] < x2 + b_WIDTH:
-            pygame.draw.rect(window, (204, 197, 110), b2)
-        else:
-            pygame.draw.rect(window, (204, 197, 110), b2, 3)
+        # Draw buttons, filled when the mouse is over them
+        buttons = [(x1, "Easy", (117, 172, 112)), (x2, "Medium", (204, 197, 110)),
+                   (x3, "Hard", (199, 129, 48)), (x4, "Evil", (207, 68, 68))]
 
-        if y < mouse[1] < y + b_HEIGHT and x3 < mouse[0] < x3 + b_WIDTH:
-            pygame.draw.rect(window, (199, 129, 48), b3)
-        else:
-            pygame.draw.rect(window, (199, 129, 48), b3, 3)
-
-        if y < mouse[1] < y + b_HEIGHT and x4 < mouse[0] < x4 + b_WIDTH:
-            pygame.draw.rect(window, (207, 68, 68), b4)
-        else:
-            pygame.draw.rect(window, (207, 68, 68), b4, 3)
-
-        # Button Texts
-        text1 = SMALL_FONT.render("Easy", True, BLACK)
-        text2 = SMALL_FONT.render("Medium", True, BLACK)
-        text3 = SMALL_FONT.render("Hard", True, BLACK)
-        text4 = SMALL_FONT.render("Evil", True, BLACK)
-
-        window.blit(text1, (x1 + (b_WIDTH - text1.get_width()) // 2, y + (b_HEIGHT - text1.get_height()) // 2))
-        window.blit(text2, (x2 + (b_WIDTH - text2.get_width()) // 2, y + (b_HEIGHT - text2.get_height()) // 2))
-        window.blit(text3, (x3 + (b_WIDTH - text3.get_width()) // 2, y + (b_HEIGHT - text3.get_height()) // 2))
-        window.blit(text4, (x4 + (b_WIDTH - text4.get_width()) // 2, y + (b_HEIGHT - text4.get_height()) // 2))
+        for bx, label, color in buttons:
+            hover = y < mouse[1] < y + b_HEIGHT and bx < mouse[0] < bx + b_WIDTH
+            window.blit(button_surface(label, color, (b_WIDTH, b_HEIGHT), hover, (230, 230, 230)), (bx, y))
 
         # Updating display at every iteration
         pygame.display.update()
+        STARTUP.first_frame()
+
+        if icon is not None and icon.apply():
+            icon = None
 
         # Fixing number of iterations every second
-        clock.tick(60)
+        clock.tick(fps)
 
     # Returning selected difficulty to main loop
     return diff
 
 
-# Main function containing main loop for the game
-def main():
+# Milliseconds until the displayed play time changes, play time is rounded to whole seconds
+def until_next_second(start):
+    elapsed = time.time() - start
+    return max(1, int((round(elapsed) + 0.5 - elapsed) * 1000) + 1)
+
+
+# Window title showing how much work the last solve of the board took
+def stats_caption(stats):
+    if stats is None:
+        return "Sudoku"
+    if stats.cached:
+        return "Sudoku - last solve: {:.1f} ms, from the solution cache".format(stats.elapsed * 1000)
+    return "Sudoku - last solve: {:.1f} ms, {} nodes, {} backtracks, depth {}".format(
+        stats.elapsed * 1000, stats.nodes, stats.backtracks, stats.max_depth)
+
+
+# Main function containing main loop for the game, box gives the board size (3 for 9x9, 4 for 16x16, ...)
+def main(fps=FPS, box=BOX):
     window = pygame.display.set_mode((WIDTH, HEIGHT))
+    STARTUP.mark('window')
 
     # Game title
     pygame.display.set_caption("Sudoku")
 
     # Game icon
-    SUDOKU_ICON = pygame.image.load(os.path.join('Images', 'sudoku_icon.jpg'))
-    pygame.display.set_icon(SUDOKU_ICON)
+    icon = IconLoader().start()
+
+    if os.path.exists(PUZZLE_STORE):
+        set_puzzle_store(PUZZLE_STORE)
+
+    # Solutions are kept in memory only when the cache file can't be opened
+    try:
+        os.makedirs(os.path.dirname(SOLUTION_CACHE), exist_ok=True)
+        set_solution_cache(SolutionCache(path=SOLUTION_CACHE))
+    except OSError:
+        set_solution_cache(SolutionCache())
+
+    # Fetching puzzles of every difficulty in the background while the menu is shown,
+    # puzzles of other sizes are generated when the board is created
+    prefetcher = PuzzlePrefetcher().start() if box == 3 else None
 
     # Difficulty selected from main menu window
-    diff = menu(window)
+    diff = menu(window, icon, fps)
 
     # Initializing the Board
-    board = Board(ROWS, COLS, WIDTH, WIDTH, diff)
+    board = Board(box * box, box * box, WIDTH, WIDTH, diff, prefetcher)
+    if prefetcher is not None:
+        prefetcher.stop()
 
     # Stores last key pressed
     key = None
@@ -498,13 +1034,36 @@ def main():
     # Stores type of strike
     strikes = 0
 
+    # Redraws only what changed between frames
+    renderer = DirtyRenderer()
+
+    # Solves in the background and animates the solution
+    auto = AutoSolver(board)
+
+    # Statistics shown in the window title
+    caption_stats = None
+
+    # Set when the last frame drew nothing, the loop then sleeps until an event or the next timer second
+    idle = False
+
     run = True
     while run:
+        # Input: collecting events, blocking while idle
+        if idle:
+            event = pygame.event.wait(until_next_second(start))
+            events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+        else:
+            events = pygame.event.get()
+
         # Time since game has started
         play_time = round(time.time() - start)
 
         # Iterating every pygame events
-        for event in pygame.event.get():
+        for event in events:
+            # Window resized or uncovered, everything has to be drawn again
+            if event.type in (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE):
+                renderer.invalidate()
+
             # If quit button on the window is pressed
             if event.type == pygame.QUIT:
                 text = "Exiting.."
@@ -532,6 +1091,17 @@ def main():
                     key = 8
                 if event.key == pygame.K_9:
                     key = 9
+                if event.key == pygame.K_0:
+                    key = 0
+
+                # Numbers above 9 on larger boards are typed as two digits, 1 then 6 pencils 16
+                if pygame.K_0 <= event.key <= pygame.K_9:
+                    x, y = board.selected
+                    number = board.cube(x, y).temp * 10 + key
+                    if board.size > 9 and 10 <= number <= board.size:
+                        key = number
+                    if key == 0 or key > board.size:
+                        key = None
 
                 # Navigating to neighbouring cells using keyboard arrows
                 if event.key == pygame.K_UP:
@@ -561,9 +1131,9 @@ def main():
                 if event.key == pygame.K_RETURN:
                     x, y = board.selected
 
-                    if board.cubes[x][y].temp != 0:
+                    if board.cube(x, y).temp != 0:
 
-                        if board.insert(board.cubes[x][y].temp):
+                        if board.insert(board.cube(x, y).temp):
                             print("Success!")
                             strikes = 2
                         else:
@@ -579,17 +1149,34 @@ def main():
                         draw_winner(window, text)
                         run = False
 
+            # Auto solve worker finished, revealing the solution
+            if event.type == SOLVED_EVENT and not event.cancelled.is_set():
+                if event.solution is not None:
+                    print("Puzzle auto solved !!")
+                    auto.reveal(event.solution)
+                else:
+                    print("Puzzle cannot be solved..")
+                    text = "Puzzle cannot be solved.."
+                    draw_lose(window, text, RED)
+                    run = False
+
             # If any key pressed on keyboard
             if event.type == pygame.KEYDOWN:
                 # Auto solving the puzzle if possible on pressing Space key on the keyboard
                 if event.key == pygame.K_SPACE:
-                    if auto_solve(window, board):
-                        print("Puzzle auto solved !!")
-                    else:
-                        print("Puzzle cannot be solved..")
-                        text = "Puzzle cannot be solved.."
-                        draw_lose(window, text, RED)
-                        run = False
+                    auto.start()
+
+                # Cancelling auto solve with the Escape key
+                if event.key == pygame.K_ESCAPE and auto.busy():
+                    auto.cancel()
+
+                # Selecting the next cell that can be filled and pencilling its digit on pressing H key
+                if event.key == pygame.K_h:
+                    hint = board.hint()
+                    if hint:
+                        board.select(hint[0], hint[1])
+                        board.temp(hint[2])
+                        key = None
 
                 # Exiting the game if X key is pressed on the keyboard
                 if event.key == pygame.K_x:
@@ -614,13 +1201,7 @@ def main():
 
                 # Auto solving if possible when Solve button is clicked
                 if y < pos[1] < y + B_HEIGHT and x < pos[0] < x + B_WIDTH:
-                    if auto_solve(window, board):
-                        print("Puzzle auto solved !!")
-                    else:
-                        print("Puzzle cannot be solved..")
-                        text = "Puzzle cannot be solved.."
-                        draw_lose(window, text, RED)
-                        run = False
+                    auto.start()
 
                 # Quiting when Quit button is clicked
                 if y < pos[1] < y + B_HEIGHT and x + 2 * gap < pos[0] < x + 2 * gap + B_WIDTH:
@@ -628,19 +1209,41 @@ def main():
                     draw_lose(window, text, RED)
                     run = False
 
-            # Setting the temporary value on the selected key if number key is pressed
-            if board.selected and key != None:
-                board.temp(key)
+        if not run:
+            break
+
+        # Update: setting the temporary value on the selected key if number key is pressed
+        if board.selected and key != None:
+            board.temp(key)
+
+        # Revealing the next cells of an auto solve
+        auto.update()
+
+        if board.last_stats is not caption_stats:
+            caption_stats = board.last_stats
+            pygame.display.set_caption(stats_caption(caption_stats))
 
-            # Drawing the board at every iteration
-            redraw_window(window, board, play_time, strikes, diff)
+        # Render: drawing the parts of the board that changed, once per frame
+        rects = renderer.draw(window, board, play_time, strikes, diff)
 
-            # Updating display at every iteration
-            pygame.display.update()
+        # Updating only those parts of the display
+        if rects:
+            pygame.display.update(rects)
+        idle = not rects and not auto.busy()
 
-            # Fixing number of iterations per second
-            clock.tick(60)
+        # Limiting the number of frames per second
+        clock.tick(fps)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Sudoku game")
+    parser.add_argument('-b', '--box', type=int, default=BOX, choices=(2, 3, 4, 5),
+                        help="box size: 3 for 9x9, 4 for 16x16 and 5 for 25x25 boards")
+    parser.add_argument('--fps', type=int, default=FPS, help="maximum frames drawn per second, 0 for no limit")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="print how long the game took to show the menu")
+    args = parser.parse_args()
+
+    if args.startup_time:
+        STARTUP.hooks.append(lambda timer: print(timer.report()))
+    main(fps=args.fps, box=args.box)
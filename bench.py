@@ -0,0 +1,226 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import solver
+from bulk_solve import parse_line
+from generator import random_solution
+from timing import percentile, to_ms
+
+CORPORA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'corpora')
+
+# Reference corpora shipped with the benchmark, easy boards, hard boards and boards known to be
+# pathological for row-major backtracking such as the "anti brute force" puzzle
+CORPORA = ('easy', 'hard', 'pathological')
+
+# Box sizes timed by the scaling benchmark, 4x4 to 25x25 boards
+SCALING_BOXES = (2, 3, 4, 5)
+
+# Share of the cells kept as givens in the scaling puzzles. Few enough givens that singles cannot solve
+# the puzzles and every size needs a search, around 0.3 some 25x25 boards take minutes.
+SCALING_GIVENS = 0.2
+
+
+# Reading the puzzles of a corpus as 81 character lines
+def load_corpus(name):
+    with open(os.path.join(CORPORA_DIR, name + '.txt')) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+# Puzzles are 81 character lines or grids of any size
+def _grid(puzzle):
+    return parse_line(puzzle) if isinstance(puzzle, str) else [list(row) for row in puzzle]
+
+
+# Solving one puzzle in the worker process without instrumentation, returns seconds taken and whether it was solved
+def _time_one(engine, puzzle):
+    grid = _grid(puzzle)
+
+    start = time.perf_counter()
+    solved = solver.solve(grid, engine)
+    return time.perf_counter() - start, solved
+
+
+# Search nodes of an instrumented solve of one puzzle in the worker process
+def _count_nodes(engine, puzzle):
+    stats = solver.SolveStats()
+    solver.solve(_grid(puzzle), engine, stats)
+    return stats.nodes
+
+
+# Running func in the worker process, returns its result and the pool to use next,
+# a call taking longer than timeout seconds is stopped with a fresh pool and gives None
+def _run_in(pool, timeout, func, *args):
+    try:
+        return pool.apply_async(func, args).get(timeout), pool
+    except multiprocessing.TimeoutError:
+        pool.terminate()
+        return None, multiprocessing.Pool(1)
+
+
+# Timing every puzzle of a corpus with one engine. Each puzzle is solved repeat times in a worker process and
+# the fastest run is kept. A run taking longer than timeout seconds is stopped and the puzzle counted as
+# a timeout, taking the timeout as its time so slow engines are not made to look fast by leaving it out.
+# Nodes come from a separate instrumented solve, which does not count towards the time or the timeouts.
+def run_corpus(engine, puzzles, timeout=10.0, repeat=3):
+    times, finished, nodes = [], [], []
+    solved = timeouts = 0
+
+    pool = multiprocessing.Pool(1)
+    try:
+        for puzzle in puzzles:
+            runs = []
+            for i in range(repeat):
+                result, pool = _run_in(pool, timeout, _time_one, engine, puzzle)
+                if result is None:
+                    break
+                runs.append(result)
+
+            if len(runs) < repeat:
+                timeouts += 1
+                times.append(timeout)
+                continue
+
+            elapsed = min(t for t, ok in runs)
+            times.append(elapsed)
+            finished.append(elapsed)
+            solved += runs[0][1]
+
+            if engine in solver.INSTRUMENTED:
+                n, pool = _run_in(pool, timeout, _count_nodes, engine, puzzle)
+                if n is not None:
+                    nodes.append(n)
+    finally:
+        pool.terminate()
+
+    total = sum(finished)
+    return {
+        'puzzles': len(puzzles),
+        'solved': solved,
+        'timeouts': timeouts,
+        'median': percentile(times, 0.5),
+        'p95': percentile(times, 0.95),
+        'nodes': percentile(nodes, 0.5),
+        'per_second': len(finished) / total if total else None,
+    }
+
+
+def run(engines, corpora, timeout=10.0, repeat=3):
+    results = {}
+    for engine in engines:
+        for corpus in corpora:
+            results['{}/{}'.format(engine, corpus)] = run_corpus(engine, load_corpus(corpus), timeout, repeat)
+    return results
+
+
+# Puzzle made by removing random clues from a random solution until only the given share of the cells is left.
+# Unlike generate() removals are not checked, so the puzzle may have several solutions and needs a search.
+def search_puzzle(rng, box=3, givens=SCALING_GIVENS):
+    size = box * box
+    grid = random_solution(rng, box)
+
+    for i in rng.sample(range(size * size), size * size - int(givens * size * size)):
+        grid[i // size][i % size] = 0
+    return grid
+
+
+# Puzzles of every box size, the same for every run with the same seed
+def scaling_puzzles(boxes=SCALING_BOXES, count=5, givens=SCALING_GIVENS, seed=0):
+    rng = random.Random(seed)
+    return {box: [search_puzzle(rng, box, givens) for i in range(count)] for box in boxes}
+
+
+# Timing how solve time and search nodes grow with the board size, results are named like 'bitmask/16x16'
+def run_scaling(engines, boxes=SCALING_BOXES, count=5, timeout=10.0, seed=0, givens=SCALING_GIVENS, repeat=3):
+    puzzles = scaling_puzzles(boxes, count, givens, seed)
+
+    results = {}
+    for engine in engines:
+        for box in boxes:
+            name = '{}/{}x{}'.format(engine, box * box, box * box)
+            results[name] = run_corpus(engine, puzzles[box], timeout, repeat)
+    return results
+
+
+def _ms(seconds):
+    return '-' if seconds is None else '{:.3f}'.format(to_ms(seconds))
+
+
+def print_report(results, out=sys.stdout):
+    header = '{:<26}{:>8}{:>10}{:>12}{:>12}{:>10}{:>12}'
+    out.write(header.format('engine/corpus', 'solved', 'timeouts', 'median ms', 'p95 ms', 'nodes', 'puzzles/s') + '\n')
+    for name, r in results.items():
+        out.write(header.format(
+            name, '{}/{}'.format(r['solved'], r['puzzles']), r['timeouts'], _ms(r['median']), _ms(r['p95']),
+            '-' if r['nodes'] is None else r['nodes'],
+            '-' if r['per_second'] is None else '{:.1f}'.format(r['per_second'])) + '\n')
+
+
+# Comparing against a baseline, returns descriptions of every result whose median or p95 time grew by more
+# than threshold (0.25 = 25% slower), or that solved or finished fewer puzzles than before
+def find_regressions(results, baseline, threshold=0.25):
+    regressions = []
+
+    for name, base in baseline.items():
+        r = results.get(name)
+        if r is None:
+            continue
+
+        if r['solved'] < base['solved'] or r['timeouts'] > base['timeouts']:
+            regressions.append("{}: solved {} (was {}), timeouts {} (was {})".format(
+                name, r['solved'], base['solved'], r['timeouts'], base['timeouts']))
+            continue
+
+        for key in ('median', 'p95'):
+            if base[key] and r[key] and r[key] > base[key] * (1 + threshold):
+                regressions.append("{}: {} {} ms (baseline {} ms)".format(name, key, _ms(r[key]), _ms(base[key])))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solver engines on the bundled corpora")
+    parser.add_argument('-e', '--engine', action='append', choices=sorted(solver.ENGINES),
+                        help="engine to time, all engines by default")
+    parser.add_argument('-c', '--corpus', action='append', choices=CORPORA, help="corpus to use, all by default")
+    parser.add_argument('--scaling', action='store_true',
+                        help="time random 4x4 to 25x25 boards instead of the corpora")
+    parser.add_argument('-n', '--count', type=int, default=5, help="puzzles of each size for --scaling")
+    parser.add_argument('-g', '--givens', type=float, default=SCALING_GIVENS,
+                        help="share of the cells kept as givens for --scaling")
+    parser.add_argument('-t', '--timeout', type=float, default=10.0, help="seconds allowed per puzzle")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="timed runs of each puzzle, the fastest is kept")
+    parser.add_argument('--save', metavar='FILE', help="write the results as a baseline file")
+    parser.add_argument('--baseline', metavar='FILE', help="fail if the results regress from this baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    engines = args.engine or sorted(solver.ENGINES)
+    if args.scaling:
+        results = run_scaling(engines, count=args.count, timeout=args.timeout, givens=args.givens,
+                              repeat=args.repeat)
+    else:
+        results = run(engines, args.corpus or CORPORA, args.timeout, args.repeat)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("Regression: " + line, file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
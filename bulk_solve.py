@@ -0,0 +1,101 @@
+import argparse
+import itertools
+import multiprocessing
+import sys
+
+import solver
+from solution_cache import SolutionCache
+
+
+# Converting an 81 character line ('0' or '.' for empty cells) to a 9x9 grid, None if the line is not a puzzle
+def parse_line(line):
+    line = line.strip()
+    if len(line) != 81:
+        return None
+
+    board = [[0 for x in range(9)] for x in range(9)]
+
+    for index, ch in enumerate(line):
+        if ch in '.0':
+            continue
+        if not '1' <= ch <= '9':
+            return None
+        board[index // 9][index % 9] = int(ch)
+
+    return board
+
+
+# Converting a 9x9 grid back to an 81 character line
+def format_grid(grid):
+    return ''.join(str(n) for row in grid for n in row)
+
+
+# Selecting the solver engine inside every worker process, and giving it a solution cache of cache_size
+# puzzles so equivalent puzzles in the input are only searched once per worker
+def _init_worker(engine, cache_size=0):
+    solver.set_engine(engine)
+    if cache_size:
+        solver.set_solution_cache(SolutionCache(cache_size))
+
+
+# Solving one input line, unsolvable or malformed lines are returned unchanged with a failure flag
+def solve_line(line):
+    grid = parse_line(line)
+    if grid is not None and solver.solve(grid):
+        return format_grid(grid), True
+    return line.strip(), False
+
+
+# Solving every line from infile with a pool of worker processes and writing results to outfile in input order.
+# Input is read in windows of a few chunks per worker so the whole file is never held in memory.
+def bulk_solve(infile, outfile, workers=None, chunk_size=64, engine='bitmask', cache_size=0):
+    workers = workers or multiprocessing.cpu_count()
+    window = workers * chunk_size * 4
+
+    solved = failed = 0
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(engine, cache_size)) as pool:
+        lines = (line for line in infile if line.strip())
+        while True:
+            batch = list(itertools.islice(lines, window))
+            if not batch:
+                break
+
+            for result, ok in pool.imap(solve_line, batch, chunk_size):
+                outfile.write(result + '\n')
+                if ok:
+                    solved += 1
+                else:
+                    failed += 1
+            outfile.flush()
+
+    return solved, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve puzzles in the 81 character per line format")
+    parser.add_argument('input', nargs='?', default='-', help="puzzle file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="solution file, '-' for stdout")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('-c', '--chunk-size', type=int, default=64, help="puzzles sent to a worker at a time")
+    parser.add_argument('-e', '--engine', default='bitmask', choices=sorted(solver.ENGINES), help="solver engine")
+    parser.add_argument('--cache', type=int, default=0, help="solutions cached by every worker, 0 for none")
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    try:
+        solved, failed = bulk_solve(infile, outfile, args.workers, args.chunk_size, args.engine, args.cache)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    print("Solved: {}  Failed: {}".format(solved, failed), file=sys.stderr)
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+from logic import rate
+from solver import count_solutions, solve, solved_by_singles
+
+# Number of givens to stop removing at for each difficulty used by menu(), fewer givens make harder puzzles.
+# For other board sizes the same share of the cells is kept.
+TARGET_GIVENS = {
+    1: 38,
+    2: 26,
+    3: 24,
+    4: 22,
+}
+
+# Largest box size whose puzzles are checked for uniqueness by search, larger boards only keep clue removals
+# that singles can still solve, proving uniqueness by search takes minutes there
+SEARCH_MAX_BOX = 3
+
+# Puzzles drawn for a 9x9 difficulty before giving up on one rated exactly that level by logic.rate,
+# the puzzle rated closest to it is used then
+RATING_ATTEMPTS = 50
+
+
+# Random complete grid: the diagonal boxes are independent so they are filled with random permutations,
+# the rest is solved and the digits relabelled at random.
+# On 4x4 boards some diagonal boxes cannot be completed, those are drawn again.
+def random_solution(rng, box=3):
+    size = box * box
+    solved = False
+
+    while not solved:
+        grid = [[0 for x in range(size)] for x in range(size)]
+
+        for b in range(box):
+            digits = rng.sample(range(1, size + 1), size)
+            for k, n in enumerate(digits):
+                grid[b * box + k // box][b * box + k % box] = n
+
+        solved = solve(grid)
+
+    labels = [0] + rng.sample(range(1, size + 1), size)
+    return [[labels[n] for n in row] for row in grid]
+
+
+# Generating a puzzle with a unique solution of the given difficulty. On 9x9 boards the puzzle is rated by the
+# techniques logic.rate needs to solve it, and puzzles are drawn until one is rated exactly that difficulty.
+# Other sizes cannot be rated, their difficulty only sets the number of givens, as it does with rated=False
+# for callers that only need unique puzzles quickly.
+def generate(difficulty, rng=None, box=3, rated=True):
+    rng = rng or random.Random()
+    if box != 3 or not rated:
+        return _remove_clues(difficulty, rng, box)
+
+    best = best_level = None
+    for attempt in range(RATING_ATTEMPTS):
+        grid = _remove_clues(difficulty, rng, box, max_level=difficulty)
+        level = rate(grid)[1]
+        if level == difficulty:
+            return grid
+        if best is None or level > best_level:
+            best, best_level = grid, level
+
+    return best
+
+
+# Removing clues from a random solution, in symmetric pairs, while the puzzle stays unique and has more givens
+# than the difficulty's target. Puzzles singles can solve are unique without a search, on large boards
+# the target may not be reached. With max_level (9x9 only) every removal is rated by logic.rate, removals that
+# make the puzzle harder than max_level are kept back and puzzles the techniques solve are unique without a search.
+def _remove_clues(difficulty, rng, box=3, max_level=None):
+    size = box * box
+    cells = size * size
+    target = TARGET_GIVENS[difficulty] * cells // 81
+
+    grid = random_solution(rng, box)
+    givens = cells
+
+    order = list(range((cells + 1) // 2))
+    rng.shuffle(order)
+
+    for i in order:
+        j = cells - 1 - i
+        removed = 1 if i == j else 2
+        if givens - removed < target:
+            continue
+
+        (xi, yi), (xj, yj) = divmod(i, size), divmod(j, size)
+        a, b = grid[xi][yi], grid[xj][yj]
+        grid[xi][yi] = grid[xj][yj] = 0
+
+        if solved_by_singles(grid):
+            keep = True
+        elif max_level is not None:
+            score, level, used, solved = rate(grid)
+            keep = level <= max_level and (solved or count_solutions(grid, 2) == 1)
+        else:
+            keep = box <= SEARCH_MAX_BOX and count_solutions(grid, 2) == 1
+
+        if keep:
+            givens -= removed
+        else:
+            grid[xi][yi], grid[xj][yj] = a, b
+
+    return grid
+
+
+# Generating one puzzle in a worker process, seeded so runs can be repeated
+def _generate_line(args):
+    difficulty, seed = args
+    grid = generate(difficulty, random.Random(seed))
+    return ''.join(str(n) for row in grid for n in row)
+
+
+# Yielding count puzzles as 81 character lines, spread across worker processes when workers > 1
+def generate_many(count, difficulty, workers=1, seed=None):
+    rng = random.Random(seed)
+    tasks = ((difficulty, rng.getrandbits(64)) for i in range(count))
+
+    if workers == 1:
+        for task in tasks:
+            yield _generate_line(task)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        for line in pool.imap_unordered(_generate_line, tasks, 4):
+            yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate puzzles with a unique solution")
+    parser.add_argument('-n', '--count', type=int, default=10, help="number of puzzles")
+    parser.add_argument('-d', '--difficulty', type=int, default=1, choices=sorted(TARGET_GIVENS))
+    parser.add_argument('-j', '--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    start = time.perf_counter()
+
+    try:
+        for line in generate_many(args.count, args.difficulty, args.workers, args.seed):
+            out.write(line + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print("Generated {} puzzles in {:.2f}s ({:.1f} puzzles/s)".format(
+        args.count, elapsed, args.count / elapsed if elapsed else 0.0), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bulk_solve import format_grid
+from puzzle import get_puzzle, get_session, PUZZLE_URL, TIMEOUT
+
+LEVELS = (1, 2, 3, 4)
+
+# Corpus file of each difficulty, '{}' is replaced by the difficulty
+OUTPUT = os.path.join('corpus', 'level{}.txt')
+
+# Fetches per puzzle wanted before a difficulty is given up on, when the website keeps repeating puzzles
+MAX_ATTEMPTS = 3
+
+
+# Spacing requests so no more than rate of them start per second, shared by every worker
+class RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.next)
+        self.next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+# Fetching puzzles of every difficulty with a number of concurrent workers and appending the new ones to the
+# corpus files as they arrive. Requests run in a thread pool on the pooled session of get_puzzle,
+# which keeps a connection for every worker.
+# Puzzles already in the corpus files or fetched twice are skipped.
+class Harvester:
+
+    def __init__(self, output=OUTPUT, concurrency=8, rate=4.0, retries=3, backoff=1.0,
+                 url=PUZZLE_URL, timeout=TIMEOUT, fetch=get_puzzle):
+        self.output = output
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+
+        # Attempts after the first failed one, waiting backoff, 2 * backoff, 4 * backoff ... seconds before each
+        self.retries = retries
+        self.backoff = backoff
+
+        self.url = url
+        self.timeout = timeout
+        self.fetch = fetch
+
+        self.seen = set()
+        self.stats = {}
+
+    # Reading the puzzles already in the corpus files so they are not written again
+    def load_seen(self, levels):
+        for level in levels:
+            path = self.output.format(level)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.seen.update(line.strip() for line in f if line.strip())
+
+    # Fetching one puzzle as an 81 character line, retrying failed requests and empty boards, None if all failed
+    async def fetch_one(self, executor, level):
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+            await self.limiter.wait()
+            try:
+                board = await loop.run_in_executor(executor, self.fetch, level, self.url, self.timeout)
+            except requests.RequestException:
+                continue
+
+            if any(any(row) for row in board):
+                return format_grid(board)
+
+        return None
+
+    # Taking difficulties from the queue until it is empty, a duplicate puts its difficulty back
+    # until MAX_ATTEMPTS fetches per wanted puzzle have been made
+    async def worker(self, executor, jobs, files, count):
+        while True:
+            try:
+                level = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            stats = self.stats[level]
+            stats['fetched'] += 1
+            line = await self.fetch_one(executor, level)
+
+            if line is None:
+                stats['failed'] += 1
+            elif line in self.seen:
+                stats['duplicates'] += 1
+                if stats['fetched'] < count * MAX_ATTEMPTS:
+                    jobs.put_nowait(level)
+            else:
+                self.seen.add(line)
+                files[level].write(line + '\n')
+                files[level].flush()
+                stats['written'] += 1
+
+    # Harvesting count new puzzles of each difficulty, returns the fetched, written, duplicate and failed
+    # counts of every difficulty
+    async def run(self, count, levels=LEVELS):
+        self.load_seen(levels)
+        self.stats = {level: {'fetched': 0, 'written': 0, 'duplicates': 0, 'failed': 0} for level in levels}
+
+        # Difficulties interleaved so every level fills up at the same pace
+        jobs = asyncio.Queue()
+        for i in range(count):
+            for level in levels:
+                jobs.put_nowait(level)
+
+        files = {}
+        try:
+            for level in levels:
+                path = self.output.format(level)
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                files[level] = open(path, 'a')
+
+            get_session(self.concurrency)
+            with ThreadPoolExecutor(self.concurrency, thread_name_prefix='harvest') as executor:
+                await asyncio.gather(*(self.worker(executor, jobs, files, count) for i in range(self.concurrency)))
+        finally:
+            for f in files.values():
+                f.close()
+
+        return self.stats
+
+
+def harvest(count, levels=LEVELS, **options):
+    return asyncio.run(Harvester(**options).run(count, levels))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch many puzzles from the sudoku website into corpus files")
+    parser.add_argument('-n', '--count', type=int, default=100, help="new puzzles of each difficulty")
+    parser.add_argument('-l', '--level', type=int, action='append', choices=LEVELS, help="difficulty to fetch")
+    parser.add_argument('-o', '--output', default=OUTPUT, help="corpus file, '{}' is replaced by the difficulty")
+    parser.add_argument('-j', '--concurrency', type=int, default=8, help="requests in flight at once")
+    parser.add_argument('-r', '--rate', type=float, default=4.0, help="requests started per second, 0 for no limit")
+    parser.add_argument('--retries', type=int, default=3, help="retries of a failed request")
+    parser.add_argument('--backoff', type=float, default=1.0, help="seconds before the first retry, doubling")
+    parser.add_argument('--url', default=PUZZLE_URL, help="page url, '{}' is replaced by the difficulty")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    stats = harvest(args.count, args.level or LEVELS, output=args.output, concurrency=args.concurrency,
+                    rate=args.rate, retries=args.retries, backoff=args.backoff, url=args.url)
+    elapsed = time.perf_counter() - start
+
+    for level, s in stats.items():
+        print("Difficulty {}: {written} written, {duplicates} duplicates, {failed} failed, {fetched} fetched".format(
+            level, **s), file=sys.stderr)
+    fetched = sum(s['fetched'] for s in stats.values())
+    print("{} pages in {:.2f}s ({:.1f} pages/s)".format(
+        fetched, elapsed, fetched / elapsed if elapsed else 0.0), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
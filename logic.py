@@ -0,0 +1,305 @@
+from collections import Counter
+from itertools import combinations
+
+ALL_DIGITS = 0x3FE
+
+# Cell indexes (x * 9 + y) of every row, column and box, and the units and peers of each cell
+ROWS = [[x * 9 + y for y in range(9)] for x in range(9)]
+COLS = [[x * 9 + y for x in range(9)] for y in range(9)]
+BOXES = [[(x0 + i) * 9 + y0 + j for i in range(3) for j in range(3)] for x0 in range(0, 9, 3) for y0 in range(0, 9, 3)]
+UNITS = ROWS + COLS + BOXES
+
+ROW_OF = [i // 9 for i in range(81)]
+COL_OF = [i % 9 for i in range(81)]
+BOX_OF = [(i // 27) * 3 + (i % 9) // 3 for i in range(81)]
+PEERS = [sorted(set(ROWS[ROW_OF[i]] + COLS[COL_OF[i]] + BOXES[BOX_OF[i]]) - {i}) for i in range(81)]
+
+_POPCOUNT = [bin(i).count('1') for i in range(1 << 10)]
+
+# Techniques in the order they are tried, simplest first, with the difficulty weight of each use
+TECHNIQUES = [
+    ('naked_single', 1),
+    ('hidden_single', 2),
+    ('pointing', 6),
+    ('box_line', 6),
+    ('naked_pair', 8),
+    ('hidden_pair', 10),
+    ('naked_triple', 14),
+    ('hidden_triple', 16),
+    ('x_wing', 20),
+]
+
+WEIGHTS = dict(TECHNIQUES)
+
+# Difficulty level (as used by menu()) given by the hardest technique a puzzle needs
+LEVELS = {
+    'naked_single': 1,
+    'hidden_single': 1,
+    'pointing': 2,
+    'box_line': 2,
+    'naked_pair': 2,
+    'hidden_pair': 3,
+    'naked_triple': 3,
+    'hidden_triple': 3,
+    'x_wing': 4,
+}
+
+
+def _digits(mask):
+    return [n for n in range(1, 10) if mask & (1 << n)]
+
+
+# Solver applying human techniques to per-cell candidate bitmasks, one technique per step,
+# recording how often every technique was needed
+class LogicSolver:
+
+    def __init__(self, grid):
+        self.values = [grid[i // 9][i % 9] for i in range(81)]
+        self.cand = [0] * 81
+        self.used = Counter()
+        self.broken = False
+
+        for i in range(81):
+            if not self.values[i]:
+                mask = ALL_DIGITS
+                for p in PEERS[i]:
+                    mask &= ~(1 << self.values[p])
+                self.cand[i] = mask
+                if not mask:
+                    self.broken = True
+
+    # Checking if every cell is filled
+    def solved(self):
+        return all(self.values)
+
+    def grid(self):
+        return [self.values[x * 9:x * 9 + 9] for x in range(9)]
+
+    # Filling cell i with digit n and removing n from the candidates of its peers
+    def place(self, i, n):
+        self.values[i] = n
+        self.cand[i] = 0
+        bit = ~(1 << n)
+        for p in PEERS[i]:
+            if self.cand[p]:
+                self.cand[p] &= bit
+                if not self.cand[p]:
+                    self.broken = True
+
+    # Removing the digits in mask from the candidates of the given cells, True if anything was removed
+    def eliminate(self, cells, mask):
+        changed = False
+        for i in cells:
+            if self.cand[i] & mask:
+                self.cand[i] &= ~mask
+                changed = True
+                if not self.cand[i]:
+                    self.broken = True
+        return changed
+
+    # Applying the simplest technique that makes progress. Returns (technique, placement) where placement is
+    # (x, y, n) for singles and None for techniques that only remove candidates, or None when stuck.
+    def step(self):
+        if self.broken or self.solved():
+            return None
+
+        for name, weight in TECHNIQUES:
+            result = getattr(self, '_' + name)()
+            if result is not False:
+                self.used[name] += 1
+                return name, result
+
+        return None
+
+    # Applying techniques until the puzzle is solved or no technique makes progress.
+    # Singles are filled in sweeps over the whole grid, the other techniques one step at a time.
+    def solve(self):
+        while not self.broken and not self.solved():
+            if not self._fill_singles() and self.step() is None:
+                break
+        return self.solved()
+
+    # Filling every naked single and then every hidden single found in one pass, True if any was placed
+    def _fill_singles(self):
+        placed = 0
+
+        for i in range(81):
+            mask = self.cand[i]
+            if mask and not mask & (mask - 1):
+                self.place(i, mask.bit_length() - 1)
+                self.used['naked_single'] += 1
+                placed += 1
+
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                twice |= once & self.cand[i]
+                once |= self.cand[i]
+
+            single = once & ~twice
+            for i in unit:
+                if self.cand[i] & single:
+                    bit = self.cand[i] & single
+                    self.place(i, (bit & -bit).bit_length() - 1)
+                    self.used['hidden_single'] += 1
+                    placed += 1
+
+        return placed > 0
+
+    def _naked_single(self):
+        for i in range(81):
+            mask = self.cand[i]
+            if mask and not mask & (mask - 1):
+                n = mask.bit_length() - 1
+                self.place(i, n)
+                return ROW_OF[i], COL_OF[i], n
+        return False
+
+    def _hidden_single(self):
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                twice |= once & self.cand[i]
+                once |= self.cand[i]
+
+            single = once & ~twice
+            if single:
+                bit = single & -single
+                for i in unit:
+                    if self.cand[i] & bit:
+                        n = bit.bit_length() - 1
+                        self.place(i, n)
+                        return ROW_OF[i], COL_OF[i], n
+        return False
+
+    # Cells of a unit holding k candidates in total, those digits can be removed from the rest of the unit
+    def _naked_subset(self, k):
+        for unit in UNITS:
+            cells = [i for i in unit if 2 <= _POPCOUNT[self.cand[i]] <= k]
+            for group in combinations(cells, k):
+                mask = 0
+                for i in group:
+                    mask |= self.cand[i]
+                if _POPCOUNT[mask] == k:
+                    others = [i for i in unit if i not in group]
+                    if self.eliminate(others, mask):
+                        return None
+        return False
+
+    # k digits of a unit that only fit in the same k cells, other digits can be removed from those cells
+    def _hidden_subset(self, k):
+        for unit in UNITS:
+            places = {}
+            for n in range(1, 10):
+                bit = 1 << n
+                cells = [i for i in unit if self.cand[i] & bit]
+                if 2 <= len(cells) <= k:
+                    places[n] = cells
+
+            for digits in combinations(places, k):
+                cells = set()
+                for n in digits:
+                    cells.update(places[n])
+                if len(cells) == k:
+                    mask = 0
+                    for n in digits:
+                        mask |= 1 << n
+                    if self.eliminate(cells, ALL_DIGITS & ~mask):
+                        return None
+        return False
+
+    def _naked_pair(self):
+        return self._naked_subset(2)
+
+    def _naked_triple(self):
+        return self._naked_subset(3)
+
+    def _hidden_pair(self):
+        return self._hidden_subset(2)
+
+    def _hidden_triple(self):
+        return self._hidden_subset(3)
+
+    # A digit confined to one row or column inside a box is removed from the rest of that row or column
+    def _pointing(self):
+        for b, box in enumerate(BOXES):
+            for n in range(1, 10):
+                bit = 1 << n
+                cells = [i for i in box if self.cand[i] & bit]
+                if len(cells) < 2:
+                    continue
+
+                for line_of, lines in ((ROW_OF, ROWS), (COL_OF, COLS)):
+                    if len(set(line_of[i] for i in cells)) == 1:
+                        line = lines[line_of[cells[0]]]
+                        if self.eliminate([i for i in line if BOX_OF[i] != b], bit):
+                            return None
+        return False
+
+    # A digit confined to one box inside a row or column is removed from the rest of that box
+    def _box_line(self):
+        for lines in (ROWS, COLS):
+            for line in lines:
+                for n in range(1, 10):
+                    bit = 1 << n
+                    cells = [i for i in line if self.cand[i] & bit]
+                    if len(cells) < 2 or len(set(BOX_OF[i] for i in cells)) != 1:
+                        continue
+
+                    box = BOXES[BOX_OF[cells[0]]]
+                    if self.eliminate([i for i in box if i not in line], bit):
+                        return None
+        return False
+
+    # A digit fitting in the same two columns of two rows is removed from those columns in other rows,
+    # and the same with rows and columns swapped
+    def _x_wing(self):
+        for n in range(1, 10):
+            bit = 1 << n
+            for lines, cross, cross_of in ((ROWS, COLS, COL_OF), (COLS, ROWS, ROW_OF)):
+                pairs = {}
+                for line in lines:
+                    cells = [i for i in line if self.cand[i] & bit]
+                    if len(cells) == 2:
+                        key = (cross_of[cells[0]], cross_of[cells[1]])
+                        pairs.setdefault(key, []).append(set(line))
+
+                for key, found in pairs.items():
+                    if len(found) < 2:
+                        continue
+                    wing = found[0] | found[1]
+                    others = [i for c in key for i in cross[c] if i not in wing]
+                    if self.eliminate(others, bit):
+                        return None
+        return False
+
+
+# Rating a puzzle by the techniques needed to solve it without guessing.
+# Returns (score, level, techniques used, solved), level is 1 - 4 like the menu difficulties,
+# puzzles that cannot be finished with these techniques are rated level 4 with a higher score.
+def rate(grid):
+    logic = LogicSolver(grid)
+    solved = logic.solve()
+
+    score = sum(WEIGHTS[name] * count for name, count in logic.used.items())
+    level = max([LEVELS[name] for name in logic.used] or [1])
+
+    if not solved:
+        level = 4
+        score += 100 * sum(1 for n in logic.values if n == 0)
+
+    return score, level, dict(logic.used), solved
+
+
+# Next digit that can be placed by logic alone as (x, y, n, technique), None if these techniques get stuck
+def hint(grid):
+    logic = LogicSolver(grid)
+
+    while True:
+        result = logic.step()
+        if result is None:
+            return None
+
+        name, placement = result
+        if placement is not None:
+            return placement + (name,)
@@ -0,0 +1,105 @@
+import queue
+import threading
+
+from puzzle import get_puzzle, get_local_puzzle
+
+LEVELS = (1, 2, 3, 4)
+
+
+# Keeping a few puzzles of every difficulty ready so a new game never waits for the sudoku website.
+# A background thread refills the queues, and the local puzzle bank is used when the website is unreachable.
+class PuzzlePrefetcher:
+
+    def __init__(self, size=2, fetch=get_puzzle, retry_delay=5.0, wait=3.0):
+        self.size = size
+        self.fetch = fetch
+
+        # Seconds to pause after a failed fetch, and to wait for a puzzle while the website is reachable
+        self.retry_delay = retry_delay
+        self.wait = wait
+
+        self.queues = {level: queue.Queue(maxsize=size) for level in LEVELS}
+        self.online = True
+
+        self._stop = threading.Event()
+        self._wanted = threading.Event()
+        self._thread = None
+
+    # Starting the background refill thread
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="puzzle-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    # Stopping the refill thread, puzzles already queued are dropped
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        self._wanted.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Returning a puzzle of the given difficulty, from the queue if one is ready, otherwise waiting briefly
+    # for the refill thread while the website is reachable, and falling back to the local bank
+    def get(self, difficulty):
+        q = self.queues[difficulty]
+        self._wanted.set()
+
+        try:
+            return q.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self.online and self._thread is not None:
+            try:
+                return q.get(timeout=self.wait)
+            except queue.Empty:
+                pass
+
+        return get_local_puzzle(difficulty)
+
+    # Fetching one puzzle, None if the website could not be reached or returned an empty board
+    def _fetch(self, difficulty):
+        try:
+            board = self.fetch(difficulty)
+        except Exception:
+            return None
+
+        if not any(any(row) for row in board):
+            return None
+        return board
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wanted.clear()
+
+            # Emptiest queue first so the difficulty just played is refilled before the others
+            pending = [level for level in LEVELS if not self.queues[level].full()]
+            pending.sort(key=lambda level: self.queues[level].qsize())
+
+            for level in pending:
+                if self._stop.is_set():
+                    return
+
+                board = self._fetch(level)
+                if board is None:
+                    self.online = False
+                    self._stop.wait(self.retry_delay)
+                    break
+
+                self.online = True
+                try:
+                    self.queues[level].put_nowait(board)
+                except queue.Full:
+                    pass
+
+            # Sleeping until a puzzle is taken when every queue is full
+            if not pending:
+                self._wanted.wait()
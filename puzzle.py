@@ -1,34 +1,140 @@
-import requests
-from bs4 import BeautifulSoup
+import codecs
+import random
+from html.parser import HTMLParser
 
+from generator import generate
+from puzzle_store import PuzzleStore
 
-# Extracting information from the front end of the sudoku website according to difficulty
-def get_puzzle(difficulty):
+PUZZLE_URL = "https://nine.websudoku.com/?level={}"
+
+# Seconds to wait for connecting to the website and for each read from it
+TIMEOUT = (3.05, 10)
+
+# Connections the shared session keeps open to the website unless a caller asks for more
+POOL_SIZE = 8
+
+_session = None
+_pool_size = 0
+
+# Local puzzle store that get_puzzle draws from instead of the website, see set_puzzle_store
+_store = None
+
+
+# Returning the shared HTTP session, so connections to the website are pooled and reused between puzzles.
+# The pool keeps at least pool_maxsize connections, callers using the session from more threads than that
+# ask for a larger pool and the session's adapter is replaced by one that size.
+# requests is imported here so programs that never scrape (and the GUI start up) don't wait for it
+def get_session(pool_maxsize=POOL_SIZE):
+    global _session, _pool_size
+
+    if _session is None or pool_maxsize > _pool_size:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if _session is None:
+            _session = requests.Session()
+        else:
+            _session.get_adapter('https://').close()
+
+        _pool_size = pool_maxsize
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=1)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+# HTML parser collecting the values of the input cells with ids f00 - f88 in a single pass over the page,
+# without building a tree of the document
+class PuzzleParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.board = [[0 for x in range(9)] for x in range(9)]
+        self.found = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'input':
+            return
+
+        attrs = dict(attrs)
+        cid = attrs.get('id') or ''
+        if len(cid) != 3 or cid[0] != 'f' or not cid[1:].isdigit() or '9' in cid:
+            return
+
+        self.found += 1
+        value = attrs.get('value')
+        if value and value.isdigit():
+            self.board[int(cid[1])][int(cid[2])] = int(value)
+
+    # Checking if every cell of the puzzle has been seen
+    def done(self):
+        return self.found >= 81
+
+
+# Extracting the puzzle from the page html, given as a string or an iterable of string chunks.
+# Chunks after the last cell are only read, not parsed, so a streamed connection can be reused.
+def parse_puzzle(html):
+    parser = PuzzleParser()
+
+    if isinstance(html, str):
+        html = [html]
+
+    for chunk in html:
+        if not parser.done():
+            parser.feed(chunk)
+
+    return parser.board
+
+
+# Decoding the page as it is downloaded
+def _iter_text(response, chunk_size=8192):
+    decoder = codecs.getincrementaldecoder(response.encoding or 'latin-1')(errors='replace')
+    for chunk in response.iter_content(chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+# Drawing puzzles from a local store file (or open PuzzleStore) instead of the website, None to scrape again
+def set_puzzle_store(store):
+    global _store
+
+    if isinstance(store, str):
+        store = PuzzleStore(store)
+    _store = store
+
+
+# Extracting information from the front end of the sudoku website according to difficulty.
+# The website and the store only have 9x9 puzzles, other box sizes (4 for 16x16, 5 for 25x25) are generated.
+def get_puzzle(difficulty, url=PUZZLE_URL, timeout=TIMEOUT, box=3):
+    if box != 3:
+        return generate(difficulty, box=box)
+
+    # Taking a random puzzle from the local store if one is set and has puzzles of this difficulty
+    if _store is not None and _store.count(difficulty):
+        return _store.random(difficulty)
 
     # Difficulty must be from 1 - 4
-    html_doc = requests.get("https://nine.websudoku.com/?level={}".format(difficulty)).content
-    soup = BeautifulSoup(html_doc)
-    ids = ['f00', 'f01', 'f02', 'f03', 'f04', 'f05', 'f06', 'f07', 'f08',
-           'f10', 'f11', 'f12', 'f13', 'f14', 'f15', 'f16', 'f17', 'f18',
-           'f20', 'f21', 'f22', 'f23', 'f24', 'f25', 'f26', 'f27', 'f28',
-           'f30', 'f31', 'f32', 'f33', 'f34', 'f35', 'f36', 'f37', 'f38',
-           'f40', 'f41', 'f42', 'f43', 'f44', 'f45', 'f46', 'f47', 'f48',
-           'f50', 'f51', 'f52', 'f53', 'f54', 'f55', 'f56', 'f57', 'f58',
-           'f60', 'f61', 'f62', 'f63', 'f64', 'f65', 'f66', 'f67', 'f68',
-           'f70', 'f71', 'f72', 'f73', 'f74', 'f75', 'f76', 'f77', 'f78',
-           'f80', 'f81', 'f82', 'f83', 'f84', 'f85', 'f86', 'f87', 'f88']
-
-    data = []
-    for cid in ids:
-        data.append(soup.find('input', id=cid))
-
-    board = [[0 for x in range(9)] for x in range(9)]
-
-    # Enumerate iterates through the list and returns index and object at each index
-    for index, cell in enumerate(data):
-        try:
-            board[index // 9][index % 9] = int(cell['value'])
-        except:
-            pass
-
-    return board
+    with get_session().get(url.format(difficulty), timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        return parse_puzzle(_iter_text(response))
+
+
+# Small bank of puzzles for each difficulty, used when the sudoku website cannot be reached
+LOCAL_PUZZLES = {
+    1: ["003020600900305001001806400008102900700000008006708200002609500800203009005010300",
+        "200080300060070084030500209000105408000000000402706000301007040720040060004010003",
+        "000000907000420180000705026100904000050000040000507009920108000034059000507000000"],
+    2: ["030050040008010500460000012070502080000603000040109030250000098001020600080060020",
+        "020810740700003100090002805009040087400208003160030200302700060005600008076051090"],
+    3: ["100920000524010000000000070050008102000000000402700090060000000000030945000071006",
+        "043080250600000000000001094900004070000608000010200003820500000000000005034090710"],
+    4: ["800000000003600000070090200050007000000045700000100030001000068008500010090000400",
+        "000000000000003085001020000000507000004000100090000000500000073002010000000040009",
+        "000000010400000000020000000000050407008000300001090000300400200050100000000806000"],
+}
+
+
+# Picking a random puzzle of the given difficulty from the local bank
+def get_local_puzzle(difficulty):
+    line = random.choice(LOCAL_PUZZLES[difficulty])
+    return [[int(line[i * 9 + j]) for j in range(9)] for i in range(9)]
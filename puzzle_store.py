@@ -0,0 +1,222 @@
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from solver import count_solutions
+
+# File layout: header, then the records of each difficulty stored one after the other.
+# Header: magic, version, record size (41 for 4 bits per cell, 81 for one byte per cell), number of levels,
+# then the offset of the first record and the record count of every level.
+MAGIC = b'SDKS'
+VERSION = 1
+LEVELS = (1, 2, 3, 4)
+
+PACKED_SIZE = 41
+PLAIN_SIZE = 81
+
+_HEADER = struct.Struct('<4sHHI')
+_LEVEL = struct.Struct('<QQ')
+HEADER_SIZE = _HEADER.size + _LEVEL.size * len(LEVELS)
+
+# Cell values of the low and high half of every packed byte
+_NIBBLES = [(b & 0x0F, b >> 4) for b in range(256)]
+
+
+# Converting an 81 character line ('0' or '.' for empty cells) to 81 cell values
+def encode_line(line):
+    line = line.strip()
+    if len(line) != 81:
+        raise ValueError("Puzzle line must have 81 characters, got {}".format(len(line)))
+
+    cells = bytes(0 if ch == '.' else ord(ch) - 48 for ch in line)
+    if max(cells) > 9:
+        raise ValueError("Puzzle line may only contain digits and '.': {}".format(line))
+    return cells
+
+
+# Packing 81 cell values to 41 bytes, cell 2i in the low half and cell 2i + 1 in the high half of byte i
+def pack(cells):
+    out = bytearray(PACKED_SIZE)
+    for i in range(0, 80, 2):
+        out[i // 2] = cells[i] | (cells[i + 1] << 4)
+    out[40] = cells[80]
+    return bytes(out)
+
+
+def unpack(record):
+    cells = []
+    for b in record:
+        cells.extend(_NIBBLES[b])
+    return cells[:81]
+
+
+# Read only view of a puzzle store file, records are read straight from the memory map
+class PuzzleStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.record_size, levels = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or self.record_size not in (PACKED_SIZE, PLAIN_SIZE):
+            self.close()
+            raise ValueError("Not a puzzle store file: {}".format(path))
+
+        self._index = {}
+        for i, level in enumerate(LEVELS[:levels]):
+            self._index[level] = _LEVEL.unpack_from(self._map, _HEADER.size + i * _LEVEL.size)
+
+        self._view = memoryview(self._map)
+
+    # Closing the store. Records from record() are views into the map and stay valid while they are kept,
+    # so when some are still in use the map is left to be unmapped once the last of them is released.
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._file.close()
+
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Number of puzzles of the given difficulty
+    def count(self, difficulty):
+        return self._index.get(difficulty, (0, 0))[1]
+
+    # Raw record k of the given difficulty as a memoryview into the file, no bytes are copied
+    def record(self, difficulty, k):
+        offset, count = self._index.get(difficulty, (0, 0))
+        if not 0 <= k < count:
+            raise IndexError("Puzzle {} of difficulty {} not in store".format(k, difficulty))
+
+        start = offset + k * self.record_size
+        return self._view[start:start + self.record_size]
+
+    # Cell values of puzzle k as a flat list of 81 numbers
+    def cells(self, difficulty, k):
+        record = self.record(difficulty, k)
+        if self.record_size == PACKED_SIZE:
+            return unpack(record)
+        return list(record)
+
+    # Puzzle k of the given difficulty as a 9x9 grid
+    def get(self, difficulty, k):
+        cells = self.cells(difficulty, k)
+        return [cells[i * 9:i * 9 + 9] for i in range(9)]
+
+    # Puzzle k of the given difficulty as an 81 character line
+    def get_line(self, difficulty, k):
+        return ''.join(map(str, self.cells(difficulty, k)))
+
+    def random(self, difficulty):
+        return self.get(difficulty, random.randrange(self.count(difficulty)))
+
+
+# Writing a store from 81 character lines for each difficulty, e.g. {1: open('easy.txt'), 4: evil_lines}.
+# Lines are streamed to the file and the header is filled in at the end, so inputs of any size can be written.
+# With unique=True puzzles without exactly one solution are left out.
+# Returns the number of puzzles stored for each difficulty and the number left out.
+def write_store(path, levels, packed=True, unique=False):
+    record_size = PACKED_SIZE if packed else PLAIN_SIZE
+    index = []
+    rejected = 0
+
+    with open(path, 'wb') as f:
+        f.write(bytes(HEADER_SIZE))
+
+        for level in LEVELS:
+            offset, count = f.tell(), 0
+            for number, line in enumerate(levels.get(level, ())):
+                if not line.strip():
+                    continue
+                try:
+                    cells = encode_line(line)
+                except ValueError as e:
+                    raise ValueError("Difficulty {}, line {}: {}".format(level, number + 1, e))
+
+                if unique and count_solutions([cells[i:i + 9] for i in range(0, 81, 9)], 2) != 1:
+                    rejected += 1
+                    continue
+
+                f.write(pack(cells) if packed else cells)
+                count += 1
+            index.append((offset, count))
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, record_size, len(LEVELS)))
+        for offset, count in index:
+            f.write(_LEVEL.pack(offset, count))
+
+    return dict(zip(LEVELS, (count for offset, count in index))), rejected
+
+
+# Writing the puzzles of the given difficulties back out as 81 character lines
+def export_text(store, out, levels=LEVELS):
+    for level in levels:
+        for k in range(store.count(level)):
+            out.write(store.get_line(level, k) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import and export puzzle store files")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('import', help="build a store from 81 character per line text files")
+    p.add_argument('store')
+    for level in LEVELS:
+        p.add_argument('--level{}'.format(level), metavar='FILE', help="puzzles of difficulty {}".format(level))
+    p.add_argument('--plain', action='store_true', help="store 81 bytes per puzzle instead of 41")
+    p.add_argument('--unique', action='store_true', help="leave out puzzles without exactly one solution")
+
+    p = commands.add_parser('export', help="write puzzles of a store as 81 character lines")
+    p.add_argument('store')
+    p.add_argument('-l', '--level', type=int, action='append', choices=LEVELS, help="difficulty to export")
+    p.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+
+    p = commands.add_parser('info', help="show the number of puzzles of each difficulty")
+    p.add_argument('store')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        files = {level: open(getattr(args, 'level{}'.format(level)))
+                 for level in LEVELS if getattr(args, 'level{}'.format(level))}
+        try:
+            counts, rejected = write_store(args.store, files, packed=not args.plain, unique=args.unique)
+        finally:
+            for f in files.values():
+                f.close()
+        print("Imported: {}  Rejected: {}".format(counts, rejected), file=sys.stderr)
+
+    elif args.command == 'export':
+        out = sys.stdout if args.output == '-' else open(args.output, 'w')
+        try:
+            with PuzzleStore(args.store) as store:
+                export_text(store, out, args.level or LEVELS)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    else:
+        with PuzzleStore(args.store) as store:
+            for level in LEVELS:
+                print("Difficulty {}: {} puzzles".format(level, store.count(level)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import dbm
+import threading
+from collections import OrderedDict
+
+from symmetry import canonical_form
+
+# Solutions kept in memory, the least recently used are dropped first
+SIZE = 4096
+
+# Solutions kept in the file at most, once there are more the file is rewritten with only those kept in memory
+DISK_SIZE = 65536
+
+# Solutions written to the file between syncs, the file is also synced when the cache is closed
+SYNC_EVERY = 64
+
+
+# Solutions of puzzles keyed by their canonical form, so a puzzle equivalent to one solved before (relabelled,
+# transposed, or with bands, stacks, rows or columns swapped) is answered without a search, see solver.set_solution_cache.
+# The most recently used solutions are kept in memory, and up to disk_size solutions in a dbm file as well when
+# a path is given. A cache can be shared by threads, but its file must only be open in one process at a time.
+class SolutionCache:
+
+    def __init__(self, size=SIZE, path=None, disk_size=DISK_SIZE):
+        self.size = size
+        self.path = path
+        self.disk_size = disk_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = dbm.open(path, 'c') if path else None
+
+        # Solutions in the file and stores not synced to it yet
+        self._stored = len(self._db) if self._db is not None else 0
+        self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Solution cells of a canonical puzzle, b'' if it has no solution and None if it is not cached
+    def get(self, key):
+        with self._lock:
+            solution = self._entries.get(key)
+            if solution is None and self._db is not None:
+                solution = self._db.get(key)
+
+            if solution is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._remember(key, solution)
+            return solution
+
+    def put(self, key, solution):
+        with self._lock:
+            self._remember(key, solution)
+            if self._db is not None:
+                if key not in self._db:
+                    self._stored += 1
+                self._db[key] = solution
+
+                if self._stored > self.disk_size:
+                    self._prune()
+                else:
+                    self._unsynced += 1
+                    if self._unsynced >= SYNC_EVERY:
+                        self._sync()
+
+    # Syncing is costly (dbm.dumb rewrites its whole index), so it is only done every SYNC_EVERY stores
+    def _sync(self):
+        if hasattr(self._db, 'sync'):
+            self._db.sync()
+        self._unsynced = 0
+
+    # Rewriting the file with only the solutions kept in memory, the most recently used ones.
+    # Deleting keys instead would leave the file as large as before with dbm.dumb.
+    def _prune(self):
+        self._db.close()
+        self._db = dbm.open(self.path, 'n')
+        for key, solution in self._entries.items():
+            self._db[key] = solution
+        self._stored = len(self._entries)
+        self._sync()
+
+    def _remember(self, key, solution):
+        self._entries[key] = solution
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    # Filling the grid with the cached solution of an equivalent puzzle, returns whether the puzzle is solved.
+    # When it is not cached, returns None and the canonical form to pass to store() once the grid is solved.
+    def lookup(self, grid):
+        found = canonical_form(grid)
+        if found is None:
+            return None, None
+
+        key, transform = found
+        solution = self.get(key)
+        if solution is None:
+            return None, found
+
+        if solution:
+            transform.restore(solution, grid)
+        return bool(solution), None
+
+    # Caching the result of solving a grid that lookup() did not find, the grid is solved in place
+    def store(self, found, grid, solved):
+        if found is not None:
+            key, transform = found
+            self.put(key, transform.apply(grid) if solved else b'')
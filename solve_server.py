@@ -0,0 +1,440 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+import solver
+from bulk_solve import format_grid, parse_line
+from solution_cache import SolutionCache
+from timing import percentile, to_ms
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Seconds a request may take from arriving to its answer, unless it asks for another timeout
+TIMEOUT = 1.0
+
+# Most requests sent to a worker process at once, fewer when the queue is short
+BATCH_SIZE = 32
+
+# Seconds a request may hold up the requests batched after it, past that it is sent back to run on its own
+SLICE = 0.05
+
+# Requests taken in and not answered yet before connections stop being read
+QUEUE_SIZE = 1024
+
+# Latencies kept for the percentiles in the reports
+LATENCY_WINDOW = 10000
+
+OPERATIONS = ('solve', 'validate')
+
+
+# Raised inside a worker process when a request runs past its deadline
+class SolveTimeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise SolveTimeout()
+
+
+# Selecting the solver engine and solution cache size inside every worker process. Ctrl-C is left to the server,
+# and SIGALRM stops a solve that runs past its deadline.
+def _init_worker(engine, cache_size=0):
+    solver.set_engine(engine)
+    if cache_size:
+        solver.set_solution_cache(SolutionCache(cache_size))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, _alarm)
+
+
+# Solving or validating one grid in the worker, returns the response fields
+def _run_job(op, grid):
+    if op == 'validate':
+        count = solver.count_solutions(grid, 2)
+        return {'valid': count > 0, 'unique': count == 1}
+
+    if solver.solve(grid):
+        return {'solved': True, 'solution': grid}
+    return {'solved': False}
+
+
+# Running a batch of (op, grid, deadline) jobs in a worker process, deadlines are time.monotonic() values.
+# Returns the response fields of the jobs run, None for jobs that ran out of time, and whether the batch was
+# stopped because the next job took longer than SLICE with other jobs waiting behind it.
+# The batch also stops after a job runs out of time. Jobs left out of the results are queued again by the server,
+# a job that used up its slice to run on its own.
+def _run_batch(jobs):
+    results = []
+    for k, (op, grid, deadline) in enumerate(jobs):
+        left = deadline - time.monotonic()
+        if left <= 0:
+            results.append(None)
+            continue
+
+        limit = left if k == len(jobs) - 1 else min(left, SLICE)
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, limit)
+        try:
+            result = _run_job(op, grid)
+        except SolveTimeout:
+            if limit < left:
+                return results, True
+            result = None
+        finally:
+            if hasattr(signal, 'setitimer'):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        results.append(result)
+        if result is None:
+            break
+    return results, False
+
+
+# Reading the puzzle of a request, an 81 character line or a list of rows of any board size.
+# Raises ValueError when it is not a puzzle.
+def parse_puzzle(puzzle):
+    if isinstance(puzzle, str):
+        grid = parse_line(puzzle)
+        if grid is None:
+            raise ValueError("puzzle must be 81 characters of digits, '0' or '.' for empty cells")
+        return grid
+
+    if not isinstance(puzzle, list) or not puzzle:
+        raise ValueError("puzzle must be a string or a list of rows")
+    size = len(puzzle)
+    solver.shape_of(size)
+    for row in puzzle:
+        if (not isinstance(row, list) or len(row) != size or
+                not all(isinstance(n, int) and 0 <= n <= size for n in row)):
+            raise ValueError("every row must have {} numbers from 0 to {}".format(size, size))
+    return [list(row) for row in puzzle]
+
+
+# Counts and latencies of the requests answered by the server, reported as throughput and percentiles
+class ServiceStats:
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.monotonic()
+        self.latencies = deque(maxlen=window)
+
+        self.requests = 0
+        self.answered = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched = 0
+
+    def record(self, latency):
+        self.answered += 1
+        self.latencies.append(latency)
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        latencies = list(self.latencies)
+        return {
+            'requests': self.requests,
+            'answered': self.answered,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'per_second': self.answered / elapsed if elapsed else 0.0,
+            'mean_batch': self.batched / self.batches if self.batches else 0.0,
+            'p50_ms': to_ms(percentile(latencies, 0.5)),
+            'p95_ms': to_ms(percentile(latencies, 0.95)),
+            'p99_ms': to_ms(percentile(latencies, 0.99)),
+        }
+
+    def report(self):
+        return ("{requests} requests, {answered} answered, {timeouts} timeouts, {errors} errors, "
+                "{per_second:.0f}/s, mean batch {mean_batch:.1f}, "
+                "latency p50 {p50_ms} ms, p95 {p95_ms} ms, p99 {p99_ms} ms").format(**self.as_dict())
+
+
+# Serving solves and validations as JSON lines. Requests are queued, grouped into batches and run by a pool
+# of worker processes forked when the server starts. At most queue_size requests are taken in at once, past that
+# connections are no longer read, so busy clients are slowed down instead of piling up requests.
+class SolveServer:
+
+    def __init__(self, workers=None, engine='bitmask', batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 timeout=TIMEOUT, cache_size=0):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.engine = engine
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        self.stats = ServiceStats()
+        self.pool = None
+        self.queue = None
+        self._slots = None
+        self._in_flight = None
+        self._batcher = None
+
+        # Request taken from the queue that has to run on its own, kept for the next batch
+        self._held = None
+
+        # Open connections, handler task and its writer
+        self._connections = {}
+
+    # Forking the worker pool and starting to batch queued requests
+    def start(self):
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.engine, self.cache_size))
+        self.queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.queue_size)
+
+        # Batches sent to the pool and not answered yet, one per worker so batches only go to idle workers
+        self._in_flight = asyncio.Semaphore(self.workers)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        return self
+
+    # Stopping the server: queued requests are failed, connections are closed once their answers are sent
+    # (waiting at most wait seconds) and the worker pool is stopped
+    async def close(self, wait=1.0):
+        if self._batcher is not None:
+            self._batcher.cancel()
+
+        while self.queue is not None and not self.queue.empty():
+            future = self.queue.get_nowait()[3]
+            if not future.done():
+                future.set_exception(ConnectionAbortedError("server is shutting down"))
+
+        for writer in self._connections.values():
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=wait)
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    # Answering one request, a dict with op, puzzle, optional id and timeout in seconds
+    async def submit(self, request):
+        received = time.monotonic()
+        self.stats.requests += 1
+        response = {'id': request.get('id')}
+
+        try:
+            op = request.get('op', 'solve')
+            if op == 'stats':
+                response.update(ok=True, stats=self.stats.as_dict())
+                return response
+            if op not in OPERATIONS:
+                raise ValueError("unknown op: {}".format(op))
+            grid = parse_puzzle(request.get('puzzle'))
+            timeout = float(request.get('timeout', self.timeout))
+        except (ValueError, TypeError) as e:
+            self.stats.errors += 1
+            response.update(ok=False, error=str(e))
+            return response
+
+        deadline = received + timeout
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((op, grid, deadline, future, False))
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            result = None
+        except Exception as e:
+            self.stats.errors += 1
+            response.update(ok=False, error=str(e) or repr(e))
+            return response
+
+        if result is None:
+            self.stats.timeouts += 1
+            response.update(ok=False, error='timeout')
+            return response
+
+        if 'solution' in result and isinstance(request['puzzle'], str):
+            result['solution'] = format_grid(result['solution'])
+        response.update(ok=True, **result)
+        self.stats.record(time.monotonic() - received)
+        return response
+
+    # Giving queued requests to idle workers. The queue is shared out between the workers, so a batch holds
+    # one request when the server is quiet and up to batch_size when requests are waiting. A request that runs
+    # longer than SLICE in a batch is sent back and runs alone, so it holds up the others for at most SLICE.
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._in_flight.acquire()
+            if self._held is not None:
+                batch, self._held = [self._held], None
+            else:
+                batch = [await self.queue.get()]
+
+            size = 1 if batch[0][4] else min(self.batch_size, -(-(1 + self.queue.qsize()) // self.workers))
+            while len(batch) < size and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item[4]:
+                    self._held = item
+                    break
+                batch.append(item)
+
+            # Requests whose client already gave up are not sent to a worker
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                self._in_flight.release()
+                continue
+
+            self.stats.batches += 1
+            self.stats.batched += len(batch)
+            futures = [item[3] for item in batch]
+            jobs = [item[:3] for item in batch]
+
+            self.pool.apply_async(
+                _run_batch, (jobs,),
+                callback=lambda results, batch=batch: loop.call_soon_threadsafe(self._finish, batch, results),
+                error_callback=lambda e, futures=futures: loop.call_soon_threadsafe(self._fail, futures, e))
+
+    # Answering the requests of a finished batch. Requests the worker did not start are queued again,
+    # followed by the request that used up its slice, so they don't wait for it a second time
+    def _finish(self, batch, outcome):
+        results, stopped = outcome
+        self._in_flight.release()
+
+        alone = None
+        for k, item in enumerate(batch):
+            future = item[3]
+            if future.done():
+                continue
+            if k < len(results):
+                future.set_result(results[k])
+            elif k == len(results) and stopped:
+                alone = item[:4] + (True,)
+            else:
+                self.queue.put_nowait(item)
+
+        if alone is not None:
+            self.queue.put_nowait(alone)
+
+    def _fail(self, futures, error):
+        self._in_flight.release()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    # Reading JSON lines from one connection, requests are answered as they finish, not in the order sent
+    async def handle(self, reader, writer):
+        self._connections[asyncio.current_task()] = writer
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def send(response):
+            if writer.is_closing():
+                return
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        async def answer(request):
+            try:
+                await send(await self.submit(request))
+            finally:
+                self._slots.release()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    self.stats.requests += 1
+                    self.stats.errors += 1
+                    await send({'id': None, 'ok': False, 'error': str(e)})
+                    continue
+
+                # Waiting for a free slot stops reading from this connection while the server is busy
+                await self._slots.acquire()
+                task = asyncio.create_task(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+
+# Printing the statistics every interval seconds while requests are coming in
+async def _report_loop(stats, interval):
+    last = 0
+    while True:
+        await asyncio.sleep(interval)
+        if stats.requests != last:
+            last = stats.requests
+            print(stats.report(), file=sys.stderr)
+
+
+async def serve(host=HOST, port=PORT, path=None, report=10.0, **options):
+    service = SolveServer(**options).start()
+    if path is not None:
+        server = await asyncio.start_unix_server(service.handle, path)
+        where = path
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        where = '{}:{}'.format(host, port)
+    print("Solving with {} workers on {}".format(service.workers, where), file=sys.stderr)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass
+
+    reporter = asyncio.create_task(_report_loop(service.stats, report)) if report else None
+    try:
+        await stop.wait()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        server.close()
+        await service.close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        print(service.stats.report(), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve sudoku solves and validations as JSON lines")
+    parser.add_argument('--host', default=HOST, help="address to listen on")
+    parser.add_argument('-p', '--port', type=int, default=PORT, help="port to listen on")
+    parser.add_argument('-s', '--socket', default=None, help="unix socket path, used instead of the port")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('-e', '--engine', default='bitmask', choices=sorted(solver.ENGINES), help="solver engine")
+    parser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE, help="requests sent to a worker at once")
+    parser.add_argument('-q', '--queue-size', type=int, default=QUEUE_SIZE, help="requests waiting for a worker")
+    parser.add_argument('-t', '--timeout', type=float, default=TIMEOUT, help="default seconds per request")
+    parser.add_argument('--cache', type=int, default=0, help="solutions cached by every worker, 0 for none")
+    parser.add_argument('-r', '--report', type=float, default=10.0,
+                        help="seconds between statistics reports, 0 for none")
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args.host, args.port, args.socket, args.report, workers=args.workers, engine=args.engine,
+                      batch_size=args.batch_size, queue_size=args.queue_size, timeout=args.timeout,
+                      cache_size=args.cache))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
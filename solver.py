@@ -1,4 +1,65 @@
-import numpy as np
+from collections import namedtuple
+
+import math
+import sys
+import time
+
+
+# Bitmask of all digits 1 - 9, digit n is stored at bit n
+ALL_DIGITS = 0x3FE
+
+# Number of set bits for every candidate mask
+_POPCOUNT = [bin(i).count('1') for i in range(1 << 10)]
+
+# Index of the 3x3 box each cell belongs to
+_BOX = [[(x // 3) * 3 + y // 3 for y in range(9)] for x in range(9)]
+
+# Every row, column and box as a list of cell coordinates
+_UNITS = ([[(x, y) for y in range(9)] for x in range(9)] +
+          [[(x, y) for x in range(9)] for y in range(9)] +
+          [[(x0 + i, y0 + j) for i in range(3) for j in range(3)] for x0 in range(0, 9, 3) for y0 in range(0, 9, 3)])
+
+# Tables of one board size: size x size cells in box x box boxes, mask of all digits 1 - size,
+# box index of every cell, every unit as a list of cells and a function counting the digits of a mask
+Shape = namedtuple('Shape', ['size', 'box', 'digits', 'box_of', 'units', 'popcount'])
+
+_SHAPES = {}
+
+
+def _bit_count(mask):
+    return bin(mask).count('1')
+
+
+# Returning the tables for boards of the given size (9, 16, 25, ...), built the first time a size is used
+def shape_of(size):
+    shape = _SHAPES.get(size)
+    if shape is not None:
+        return shape
+
+    box = math.isqrt(size)
+    if box < 2 or box * box != size:
+        raise ValueError("Board size must be the square of the box size, e.g. 9, 16 or 25, got {}".format(size))
+
+    if size == 9:
+        shape = Shape(9, 3, ALL_DIGITS, _BOX, _UNITS, _POPCOUNT.__getitem__)
+    else:
+        box_of = [[(x // box) * box + y // box for y in range(size)] for x in range(size)]
+        units = ([[(x, y) for y in range(size)] for x in range(size)] +
+                 [[(x, y) for x in range(size)] for y in range(size)] +
+                 [[(x0 + i, y0 + j) for i in range(box) for j in range(box)]
+                  for x0 in range(0, size, box) for y0 in range(0, size, box)])
+        shape = Shape(size, box, (1 << (size + 1)) - 2, box_of, units, _bit_count)
+
+    _SHAPES[size] = shape
+    return shape
+
+
+# Rows of a flat buffer of cell values (bytearray, array) as writable views, so grid_view(buf)[x][y] is
+# buf[x * size + y]. Engines solve such a grid straight into the buffer, without copying it to lists.
+def grid_view(buf, size=None):
+    size = size or math.isqrt(len(buf))
+    view = memoryview(buf)
+    return [view[x * size:(x + 1) * size] for x in range(size)]
 
 
 # Checking if current value is valid
@@ -9,16 +70,18 @@ def possible(grid, x, y, n):
     temp = grid[x][y]
     grid[x][y] = 0
 
-    for i in range(0, 9):
+    size = len(grid)
+    for i in range(0, size):
         if grid[x][i] == n or grid[i][y] == n:
             grid[x][y] = temp
             return False
 
-    x0 = (x // 3) * 3
-    y0 = (y // 3) * 3
+    box = shape_of(size).box
+    x0 = (x // box) * box
+    y0 = (y // box) * box
 
-    for i in range(0, 3):
-        for j in range(0, 3):
+    for i in range(0, box):
+        for j in range(0, box):
             if grid[x0 + i][y0 + j] == n:
                 grid[x][y] = temp
                 return False
@@ -27,15 +90,16 @@ def possible(grid, x, y, n):
     return True
 
 
-# Checking if puzzle can be solved and then provide solution
-def solve(grid):
-    for x in range(0, 9):
-        for y in range(0, 9):
+# Checking if puzzle can be solved and then provide solution, scanning cells in row-major order
+def solve_backtrack(grid):
+    size = len(grid)
+    for x in range(0, size):
+        for y in range(0, size):
             if grid[x][y] == 0:
-                for n in range(1, 10):
+                for n in range(1, size + 1):
                     if possible(grid, x, y, n):
                         grid[x][y] = n
-                        if solve(grid):
+                        if solve_backtrack(grid):
                             return True
                         grid[x][y] = 0
                 return False
@@ -43,3 +107,909 @@ def solve(grid):
     # print(np.matrix(grid))
     # print()
     return True
+
+
+# Building row, column and box masks of the digits already placed, with the tables of the grid's size,
+# None if the givens conflict
+def _digit_masks(grid):
+    shape = shape_of(len(grid))
+    size, box_of = shape.size, shape.box_of
+    rows, cols, boxes = [0] * size, [0] * size, [0] * size
+
+    for x in range(size):
+        for y in range(size):
+            n = grid[x][y]
+            if n:
+                bit = 1 << n
+                b = box_of[x][y]
+                if n > size or (rows[x] | cols[y] | boxes[b]) & bit:
+                    return None
+                rows[x] |= bit
+                cols[y] |= bit
+                boxes[b] |= bit
+
+    return rows, cols, boxes, shape
+
+
+def _place(grid, masks, x, y, n):
+    rows, cols, boxes, shape = masks
+    bit = 1 << n
+    grid[x][y] = n
+    rows[x] |= bit
+    cols[y] |= bit
+    boxes[shape.box_of[x][y]] |= bit
+
+
+def _unplace(grid, masks, x, y, n):
+    rows, cols, boxes, shape = masks
+    bit = ~(1 << n)
+    grid[x][y] = 0
+    rows[x] &= bit
+    cols[y] &= bit
+    boxes[shape.box_of[x][y]] &= bit
+
+
+# Filling naked singles (one candidate left in a cell) and hidden singles (one cell left for a digit in a unit)
+# until nothing changes, recording every placement so the caller can undo them
+def _propagate(grid, masks, placed):
+    rows, cols, boxes, shape = masks
+    size, all_digits, box_of = shape.size, shape.digits, shape.box_of
+
+    changed = True
+    while changed:
+        changed = False
+
+        # Naked singles
+        for x in range(size):
+            for y in range(size):
+                if grid[x][y] == 0:
+                    cand = all_digits & ~(rows[x] | cols[y] | boxes[box_of[x][y]])
+                    if cand == 0:
+                        return False
+                    if cand & (cand - 1) == 0:
+                        n = cand.bit_length() - 1
+                        _place(grid, masks, x, y, n)
+                        placed.append((x, y, n))
+                        changed = True
+
+        # Hidden singles
+        for unit in shape.units:
+            once = twice = used = 0
+            for x, y in unit:
+                n = grid[x][y]
+                if n:
+                    used |= 1 << n
+                else:
+                    cand = all_digits & ~(rows[x] | cols[y] | boxes[box_of[x][y]])
+                    twice |= once & cand
+                    once |= cand
+
+            # A digit missing from the unit with no cell left for it
+            if (used | once) != all_digits:
+                return False
+
+            single = once & ~twice & ~used
+            while single:
+                bit = single & -single
+                single ^= bit
+                for x, y in unit:
+                    if grid[x][y] == 0 and all_digits & ~(rows[x] | cols[y] | boxes[box_of[x][y]]) & bit:
+                        n = bit.bit_length() - 1
+                        _place(grid, masks, x, y, n)
+                        placed.append((x, y, n))
+                        changed = True
+                        break
+                else:
+                    return False
+
+    return True
+
+
+# Empty cell with the fewest candidates as (x, y, candidates), None if the grid is full
+def _most_constrained(grid, masks):
+    rows, cols, boxes, shape = masks
+    size, all_digits, box_of, popcount = shape.size, shape.digits, shape.box_of, shape.popcount
+    best = None
+    best_count = size + 1
+
+    for x in range(size):
+        for y in range(size):
+            if grid[x][y] == 0:
+                cand = all_digits & ~(rows[x] | cols[y] | boxes[box_of[x][y]])
+                count = popcount(cand)
+                if count < best_count:
+                    best, best_count = (x, y, cand), count
+                    if count <= 2:
+                        return best
+
+    return best
+
+
+# Propagating and then branching on the empty cell with the fewest candidates
+def _search(grid, masks):
+    placed = []
+
+    if _propagate(grid, masks, placed):
+        best = _most_constrained(grid, masks)
+        if best is None:
+            return True
+
+        x, y, cand = best
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            n = bit.bit_length() - 1
+
+            _place(grid, masks, x, y, n)
+            if _search(grid, masks):
+                return True
+            _unplace(grid, masks, x, y, n)
+
+    for x, y, n in reversed(placed):
+        _unplace(grid, masks, x, y, n)
+
+    return False
+
+
+# Solving the puzzle in place using row, column and box candidate bitmasks
+def solve_bitmask(grid):
+    masks = _digit_masks(grid)
+    if masks is None:
+        return False
+
+    return _search(grid, masks)
+
+
+# Same search as _search, but counting solutions until limit of them have been found.
+# The first solution found is copied into the list first when one is given.
+def _count(grid, masks, limit, first=None):
+    placed = []
+    found = 0
+
+    if _propagate(grid, masks, placed):
+        best = _most_constrained(grid, masks)
+        if best is None:
+            found = 1
+            if first is not None and not first:
+                first.extend(list(row) for row in grid)
+        else:
+            x, y, cand = best
+            while cand and found < limit:
+                bit = cand & -cand
+                cand ^= bit
+                n = bit.bit_length() - 1
+
+                _place(grid, masks, x, y, n)
+                found += _count(grid, masks, limit - found, first)
+                _unplace(grid, masks, x, y, n)
+
+    for x, y, n in reversed(placed):
+        _unplace(grid, masks, x, y, n)
+
+    return found
+
+
+# Same search as _count, counting its work like _solve_bitmask_stats: every guess is a node,
+# and a guess that leads to no solution is a backtrack
+def _count_stats(grid, masks, limit, first, stats, depth=0):
+    stats.nodes += 1
+    stats.max_depth = max(stats.max_depth, depth)
+    placed = []
+    found = 0
+
+    if _propagate(grid, masks, placed):
+        stats.propagations += len(placed)
+        best = _most_constrained(grid, masks)
+        if best is None:
+            found = 1
+            if first is not None and not first:
+                first.extend(list(row) for row in grid)
+        else:
+            x, y, cand = best
+            while cand and found < limit:
+                bit = cand & -cand
+                cand ^= bit
+                n = bit.bit_length() - 1
+
+                _place(grid, masks, x, y, n)
+                branch = _count_stats(grid, masks, limit - found, first, stats, depth + 1)
+                if not branch:
+                    stats.backtracks += 1
+                found += branch
+                _unplace(grid, masks, x, y, n)
+
+    for x, y, n in reversed(placed):
+        _unplace(grid, masks, x, y, n)
+
+    return found
+
+
+# Number of solutions of the puzzle, counting stops once limit is reached so
+# count_solutions(grid, 1) only checks for a solution and count_solutions(grid, 2) for uniqueness.
+# The grid passed in is not modified, the first solution found is written into solution when it is given
+# (which may be the grid itself), so checking uniqueness also solves the puzzle.
+# Passing a SolveStats records the work of the search.
+def count_solutions(grid, limit=2, solution=None, stats=None):
+    start = time.perf_counter()
+    grid = [list(row) for row in grid]
+    masks = _digit_masks(grid)
+    first = [] if solution is not None else None
+
+    if masks is None:
+        found = 0
+    elif stats is None:
+        found = _count(grid, masks, limit, first)
+    else:
+        found = _count_stats(grid, masks, limit, first, stats)
+
+    if stats is not None:
+        stats.engine = 'bitmask'
+        stats.solved = found > 0
+        stats.elapsed = time.perf_counter() - start
+
+    if first:
+        for row, digits in zip(solution, first):
+            for y, n in enumerate(digits):
+                row[y] = n
+    return found
+
+
+# Checking if the puzzle has exactly one solution
+def is_unique(grid):
+    return count_solutions(grid, 2) == 1
+
+
+# Checking if naked and hidden singles alone solve the puzzle, which also proves it has one solution.
+# Much cheaper than count_solutions on large boards, the grid passed in is not modified.
+def solved_by_singles(grid):
+    grid = [list(row) for row in grid]
+    masks = _digit_masks(grid)
+
+    return masks is not None and _propagate(grid, masks, []) and all(all(row) for row in grid)
+
+
+# One step of a traced solve: cell (x, y) or None for the final step, digit, and kind of step
+Step = namedtuple('Step', ['cell', 'digit', 'kind'])
+
+# Kinds of steps: digit forced by propagation, digit tried on a branch, digit taken back, and the final result
+PLACE = 'place'
+GUESS = 'guess'
+BACKTRACK = 'backtrack'
+SOLVED = 'solved'
+FAILED = 'failed'
+
+
+# Same search as _search, yielding every placement and removal as it happens, returns True when solved
+def _steps(grid, masks):
+    placed = []
+    ok = _propagate(grid, masks, placed)
+
+    for x, y, n in placed:
+        yield Step((x, y), n, PLACE)
+
+    if ok:
+        best = _most_constrained(grid, masks)
+        if best is None:
+            return True
+
+        x, y, cand = best
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            n = bit.bit_length() - 1
+
+            _place(grid, masks, x, y, n)
+            yield Step((x, y), n, GUESS)
+            if (yield from _steps(grid, masks)):
+                return True
+            _unplace(grid, masks, x, y, n)
+            yield Step((x, y), n, BACKTRACK)
+
+    for x, y, n in reversed(placed):
+        _unplace(grid, masks, x, y, n)
+        yield Step((x, y), n, BACKTRACK)
+
+    return False
+
+
+# Solving the puzzle in place step by step, yielding a Step for every placement and backtrack.
+# Steps are produced lazily, so the consumer can stop at any point (the grid is then left part filled).
+# The last step has kind SOLVED or FAILED.
+def solve_steps(grid):
+    masks = _digit_masks(grid)
+
+    solved = masks is not None and (yield from _steps(grid, masks))
+    yield Step(None, 0, SOLVED if solved else FAILED)
+
+
+# Exact cover matrix for Dancing Links, for 9x9 boards 324 constraint columns:
+# cell filled (0 - 80), digit in row (81 - 161), digit in column (162 - 242), digit in box (243 - 323).
+# A board of size s has 4 * s * s columns in the same order.
+
+
+# Each of the size ** 3 candidate rows (cell, digit) covers 4 columns,
+# row r is cell r // size with digit r % size + 1
+def _dlx_row_columns(r, size=9):
+    cells = size * size
+    cell, d = divmod(r, size)
+    x, y = divmod(cell, size)
+    return (cell, cells + x * size + d, 2 * cells + y * size + d,
+            3 * cells + shape_of(size).box_of[x][y] * size + d)
+
+
+# Building the linked matrix once per board size, every solve works on copies of these lists.
+# Node 0 is the root, the column headers follow and each candidate row owns 4 following nodes.
+def _dlx_template(size=9):
+    columns = 4 * size * size
+    rows = size ** 3
+    nodes = 1 + columns + rows * 4
+    L, R, U, D = list(range(nodes)), list(range(nodes)), list(range(nodes)), list(range(nodes))
+    C, ROW = [0] * nodes, [-1] * nodes
+    S = [0] * (1 + columns)
+
+    # Header list
+    for h in range(columns + 1):
+        L[h] = h - 1 if h else columns
+        R[h] = h + 1 if h < columns else 0
+        C[h] = h
+
+    # Candidate rows appended to the bottom of each column
+    for r in range(rows):
+        first = 1 + columns + r * 4
+        for k, col in enumerate(_dlx_row_columns(r, size)):
+            node, h = first + k, col + 1
+            L[node] = first + (k - 1) % 4
+            R[node] = first + (k + 1) % 4
+            U[node], D[node] = U[h], h
+            D[U[h]] = node
+            U[h] = node
+            C[node], ROW[node] = h, r
+            S[h] += 1
+
+    return L, R, U, D, C, ROW, S
+
+
+# Linked matrix templates by board size
+_DLX = {}
+
+
+# Dancing Links (Algorithm X) over the exact cover matrix of a single puzzle
+class DancingLinks:
+
+    def __init__(self, size=9):
+        if size not in _DLX:
+            shape_of(size)
+            _DLX[size] = _dlx_template(size)
+
+        L, R, U, D, C, ROW, S = _DLX[size]
+        self.L, self.R, self.U, self.D, self.S = L[:], R[:], U[:], D[:], S[:]
+        self.C, self.ROW = C, ROW
+        self.size = size
+        self.columns = 4 * size * size
+        self.solution = []
+
+    # Removing a column header and every row that intersects it
+    def cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]], L[R[c]] = R[c], L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]], U[D[j]] = D[j], U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    # Restoring a column in exactly the reverse order of cover
+    def uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = L[R[c]] = c
+
+    # Fixing a given clue, False if one of its constraints is already satisfied by another clue
+    def select(self, r):
+        first = 1 + self.columns + r * 4
+        for node in range(first, first + 4):
+            h = self.C[node]
+            if self.L[self.R[h]] != h:
+                return False
+            self.cover(h)
+        self.solution.append(r)
+        return True
+
+    # Algorithm X, always branching on the column with the fewest remaining rows
+    def search(self):
+        R, D, S, C = self.R, self.D, self.S, self.C
+
+        if R[0] == 0:
+            return True
+
+        c = R[0]
+        best, best_size = c, S[c]
+        while c != 0 and best_size > 1:
+            if S[c] < best_size:
+                best, best_size = c, S[c]
+            c = R[c]
+
+        if best_size == 0:
+            return False
+
+        self.cover(best)
+
+        r = D[best]
+        while r != best:
+            self.solution.append(self.ROW[r])
+            j = R[r]
+            while j != r:
+                self.cover(C[j])
+                j = R[j]
+
+            if self.search():
+                return True
+
+            j = self.L[r]
+            while j != r:
+                self.uncover(C[j])
+                j = self.L[j]
+            self.solution.pop()
+            r = D[r]
+
+        self.uncover(best)
+        return False
+
+    # Fixing every given of the grid, False if two givens clash
+    def select_givens(self, grid):
+        size = self.size
+        for x in range(size):
+            for y in range(size):
+                n = grid[x][y]
+                if n and (n > size or not self.select((x * size + y) * size + n - 1)):
+                    return False
+        return True
+
+    # Writing the digits of the solution found by search into the grid
+    def fill(self, grid):
+        size = self.size
+        for r in self.solution:
+            cell, d = divmod(r, size)
+            grid[cell // size][cell % size] = d + 1
+
+
+# Solving the puzzle in place as an exact cover problem with Dancing Links
+def solve_dlx(grid):
+    dlx = DancingLinks(len(grid))
+
+    if not dlx.select_givens(grid) or not dlx.search():
+        return False
+
+    dlx.fill(grid)
+    return True
+
+
+# Work done by one solve, filled in when solve() is called with stats or a stats callback is set
+class SolveStats:
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.solved = False
+
+        # Calls to possible(), search nodes expanded, deepest recursion, branches undone,
+        # digits placed by propagation and wall time in seconds
+        self.possible_calls = 0
+        self.nodes = 0
+        self.max_depth = 0
+        self.backtracks = 0
+        self.propagations = 0
+        self.elapsed = 0.0
+
+        # Whether the solution came from the solution cache, without a search
+        self.cached = False
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return ("SolveStats(engine={}, solved={}, nodes={}, max_depth={}, backtracks={}, propagations={}, "
+                "possible_calls={}, elapsed={:.6f})").format(
+            self.engine, self.solved, self.nodes, self.max_depth, self.backtracks, self.propagations,
+            self.possible_calls, self.elapsed)
+
+
+# Same search as solve_backtrack, counting its work
+def _solve_backtrack_stats(grid, stats, depth=0):
+    stats.nodes += 1
+    stats.max_depth = max(stats.max_depth, depth)
+
+    size = len(grid)
+    for x in range(0, size):
+        for y in range(0, size):
+            if grid[x][y] == 0:
+                for n in range(1, size + 1):
+                    stats.possible_calls += 1
+                    if possible(grid, x, y, n):
+                        grid[x][y] = n
+                        if _solve_backtrack_stats(grid, stats, depth + 1):
+                            return True
+                        grid[x][y] = 0
+                        stats.backtracks += 1
+                return False
+
+    return True
+
+
+# Bitmask search counted from its trace, every guess is a node and undoing a guess is a backtrack
+def _solve_bitmask_stats(grid, stats):
+    stats.nodes = 1
+    guesses = []
+
+    for step in solve_steps(grid):
+        if step.kind == PLACE:
+            stats.propagations += 1
+        elif step.kind == GUESS:
+            guesses.append(step)
+            stats.nodes += 1
+            stats.max_depth = max(stats.max_depth, len(guesses))
+        elif step.kind == BACKTRACK:
+            if guesses and guesses[-1].cell == step.cell:
+                guesses.pop()
+                stats.backtracks += 1
+        else:
+            return step.kind == SOLVED
+
+
+# Dancing Links counting the columns it branches on
+class _CountingDancingLinks(DancingLinks):
+
+    def __init__(self, stats, size=9):
+        super().__init__(size)
+        self.stats = stats
+        self.givens = 0
+
+    def search(self):
+        stats = self.stats
+        stats.nodes += 1
+        stats.max_depth = max(stats.max_depth, len(self.solution) - self.givens)
+
+        if super().search():
+            return True
+        stats.backtracks += 1
+        return False
+
+
+# The counting search takes two frames for every digit it places, more than the default recursion limit
+# allows on 25x25 boards, so the limit is raised for the length of the search
+def _solve_dlx_stats(grid, stats):
+    dlx = _CountingDancingLinks(stats, len(grid))
+
+    if not dlx.select_givens(grid):
+        return False
+    dlx.givens = len(dlx.solution)
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 2 * len(grid) ** 2 + 100))
+    try:
+        solved = dlx.search()
+    finally:
+        sys.setrecursionlimit(limit)
+
+    if not solved:
+        return False
+
+    dlx.fill(grid)
+    return True
+
+
+# Instrumented versions of the engines, only used when statistics are asked for,
+# engines without one only get their time measured
+INSTRUMENTED = {
+    'bitmask': _solve_bitmask_stats,
+    'backtrack': _solve_backtrack_stats,
+    'dlx': _solve_dlx_stats,
+}
+
+_stats_callback = None
+
+
+# Setting a function called with the SolveStats of every solve(), None to turn statistics off again
+def set_stats_callback(func):
+    global _stats_callback
+    _stats_callback = func
+
+
+# Solver engines available to solve(), selected by name.
+# An engine is any function taking a grid (9x9, 16x16, 25x25, ...), filling it in place and returning True
+# if it was solved.
+ENGINES = {
+    'bitmask': solve_bitmask,
+    'backtrack': solve_backtrack,
+    'dlx': solve_dlx,
+}
+
+_engine = 'bitmask'
+
+
+# Adding a new solver engine so it can be selected by name
+def register_engine(name, func):
+    ENGINES[name] = func
+
+
+# Selecting the engine used by solve(), e.g. 'backtrack' to compare with the original algorithm
+def set_engine(name):
+    global _engine
+
+    if name not in ENGINES:
+        raise ValueError("Unknown solver engine: {}".format(name))
+    _engine = name
+
+
+def get_engine():
+    return _engine
+
+
+_solution_cache = None
+
+
+# Setting a cache that solve() looks puzzles up in before searching (see solution_cache.py), None to turn it off
+def set_solution_cache(cache):
+    global _solution_cache
+    _solution_cache = cache
+
+
+# Checking if puzzle can be solved and then provide solution.
+# Passing a SolveStats (or setting a stats callback) runs an instrumented version of the engine that records its work,
+# otherwise the engine runs as is. With a solution cache set, a puzzle equivalent to one solved before is filled
+# from the cache without a search.
+def solve(grid, engine=None, stats=None):
+    engine = engine or _engine
+    if _solution_cache is None:
+        return _solve_engine(grid, engine, stats)
+
+    start = time.perf_counter()
+    solved, found = _solution_cache.lookup(grid)
+    if solved is None:
+        solved = _solve_engine(grid, engine, stats)
+        _solution_cache.store(found, grid, solved)
+        return solved
+
+    if stats is not None or _stats_callback is not None:
+        if stats is None:
+            stats = SolveStats()
+        stats.engine = engine
+        stats.solved = solved
+        stats.cached = True
+        stats.elapsed = time.perf_counter() - start
+
+        if _stats_callback is not None:
+            _stats_callback(stats)
+    return solved
+
+
+# Solving with the engine, running its instrumented version when statistics are wanted
+def _solve_engine(grid, engine, stats):
+    if stats is None and _stats_callback is None:
+        return ENGINES[engine](grid)
+
+    if stats is None:
+        stats = SolveStats()
+    stats.engine = engine
+
+    start = time.perf_counter()
+    if engine in INSTRUMENTED:
+        stats.solved = INSTRUMENTED[engine](grid, stats)
+    else:
+        stats.solved = ENGINES[engine](grid)
+    stats.elapsed = time.perf_counter() - start
+
+    if _stats_callback is not None:
+        _stats_callback(stats)
+    return stats.solved
+
+
+# Copies of one grid the batch search keeps before the grid is left to solve() instead
+MAX_BRANCHES = 64
+
+# Lookup tables of the batch functions, for grids as (N, 81) arrays of digits and candidates as uint16 masks
+# with digit n at bit n: mask of each digit, digits and lowest digit of each mask, and the row, column and box
+# of each cell with the cells in box order
+BatchTables = namedtuple('BatchTables', ['bit', 'popcount', 'lowest', 'row', 'col', 'box', 'box_order'])
+
+_batch_tables = None
+_numpy = None
+
+
+# numpy, imported the first time a batch function needs it so importing the solver stays fast
+def _np():
+    global _numpy
+
+    if _numpy is None:
+        import numpy
+        _numpy = numpy
+    return _numpy
+
+
+# Building the tables the first time they are needed
+def _tables():
+    global _batch_tables
+
+    if _batch_tables is None:
+        np = _np()
+
+        cells = np.arange(81)
+        _batch_tables = BatchTables(
+            np.array([0] + [1 << n for n in range(1, 10)], dtype=np.uint16),
+            np.array(_POPCOUNT, dtype=np.uint8),
+            np.array([(m & -m).bit_length() - 1 if m else 0 for m in range(1 << 10)], dtype=np.uint8),
+            cells // 9, cells % 9, np.array(_BOX).ravel(),
+            np.array([x * 9 + y for unit in _UNITS[18:] for x, y in unit]))
+    return _batch_tables
+
+
+# Digits placed in every unit and whether one is placed twice, for units laid out as the rows of an (n, 9, 9) array
+def _batch_placed(units):
+    np = _np()
+
+    placed = np.zeros(units.shape[:2], dtype=np.uint16)
+    twice = np.zeros_like(placed)
+    for k in range(9):
+        twice |= placed & units[:, :, k]
+        placed |= units[:, :, k]
+    return placed, (twice != 0).any(axis=1)
+
+
+# Digits that are a candidate somewhere in every unit, and those that are a candidate in exactly one cell
+def _batch_once(units):
+    np = _np()
+
+    once = np.zeros(units.shape[:2], dtype=np.uint16)
+    twice = np.zeros_like(once)
+    for k in range(9):
+        twice |= once & units[:, :, k]
+        once |= units[:, :, k]
+    return once, once & ~twice
+
+
+# One round of elimination over an (n, 81) batch of grids: the candidates of every cell, which grids are
+# contradictory, and the digit of every naked or hidden single (0 elsewhere)
+def _batch_step(grids):
+    np = _np()
+
+    t = _tables()
+    bits = t.bit[grids]
+    empty = grids == 0
+
+    rows = bits.reshape(-1, 9, 9)
+    row_placed, conflict = _batch_placed(rows)
+    col_placed, twice = _batch_placed(rows.swapaxes(1, 2))
+    conflict |= twice
+    box_placed, twice = _batch_placed(bits[:, t.box_order].reshape(-1, 9, 9))
+    conflict |= twice
+
+    used = row_placed[:, t.row] | col_placed[:, t.col] | box_placed[:, t.box]
+    cand = np.where(empty, ~used & ALL_DIGITS, 0).astype(np.uint16)
+    conflict |= (empty & (cand == 0)).any(axis=1)
+
+    # A digit neither placed nor a candidate in some unit is a contradiction, one that is a candidate
+    # in a single cell of a unit goes there
+    hidden = np.zeros_like(cand)
+    units = cand.reshape(-1, 9, 9)
+    for placed, layout, index in ((row_placed, units, t.row), (col_placed, units.swapaxes(1, 2), t.col),
+                                  (box_placed, cand[:, t.box_order].reshape(-1, 9, 9), t.box)):
+        once, single = _batch_once(layout)
+        conflict |= ((placed | once) != ALL_DIGITS).any(axis=1)
+        hidden |= single[:, index]
+
+    hidden &= cand
+    naked = np.where(t.popcount[cand] == 1, cand, 0)
+    values = t.lowest[np.where(hidden != 0, hidden, naked)]
+    return cand, conflict, values
+
+
+# Filling naked and hidden singles in every grid of an (N, 81) array at once. Grids drop out of the batch
+# as soon as a round places nothing in them, solved ones after the round that checks them.
+# Returns a mask of the consistent grids and the candidates each grid was left with.
+def _batch_propagate(grids):
+    np = _np()
+
+    consistent = np.ones(len(grids), dtype=bool)
+    candidates = np.zeros(grids.shape, dtype=np.uint16)
+    active = np.arange(len(grids))
+
+    while active.size:
+        g = grids[active]
+        cand, conflict, values = _batch_step(g)
+        consistent[active[conflict]] = False
+
+        progress = ~conflict & values.any(axis=1)
+        stalled = ~progress
+        candidates[active[stalled]] = cand[stalled]
+
+        active = active[progress]
+        grids[active] = g[progress] + values[progress]
+
+    return consistent, candidates
+
+
+# Searching the consistent, unsolved grids of an (N, 81) array all together. Each round every copy of a grid
+# is split on the cell with the fewest candidates, one copy per candidate, the copies are propagated as
+# one batch and the contradictory ones dropped. The first solved copy of a grid is written back into it.
+# Grids with more than max_branches copies left are given up on, to be searched one by one.
+# Returns masks of the grids solved and given up on, grids with neither have no solution.
+def _batch_search(grids, candidates, max_branches=MAX_BRANCHES):
+    np = _np()
+
+    t = _tables()
+    solved = np.zeros(len(grids), dtype=bool)
+    given_up = np.zeros(len(grids), dtype=bool)
+
+    origin = np.arange(len(grids))
+    frontier = grids.copy()
+
+    while len(frontier):
+        counts = t.popcount[candidates]
+        counts[counts == 0] = 10
+        cell = counts.argmin(axis=1)
+        masks = candidates[np.arange(len(frontier)), cell]
+
+        branch, digit = np.nonzero((masks[:, None] >> np.arange(10, dtype=np.uint16)) & 1)
+        frontier = frontier[branch]
+        frontier[np.arange(len(frontier)), cell[branch]] = digit
+        origin = origin[branch]
+
+        consistent, candidates = _batch_propagate(frontier)
+        full = consistent & (frontier != 0).all(axis=1)
+
+        found = np.flatnonzero(full)
+        first, index = np.unique(origin[found], return_index=True)
+        grids[first] = frontier[found[index]]
+        solved[first] = True
+
+        keep = consistent & ~full & ~solved[origin]
+        given_up |= np.bincount(origin[keep], minlength=len(grids)) > max_branches
+        keep &= ~given_up[origin]
+
+        frontier, candidates, origin = frontier[keep], candidates[keep], origin[keep]
+
+    return solved, given_up
+
+
+# Solving many puzzles at once from an (N, 9, 9) array. Naked and hidden singles are eliminated for the whole
+# batch with array operations on uint16 candidate masks, then the grids still unsolved are searched together
+# by splitting them on a cell and propagating the copies as one batch. Grids that split into more than
+# max_branches copies are solved one by one with the engine.
+# Returns the solved grids and a mask of which puzzles were solved, unsolvable puzzles are returned unchanged.
+def solve_batch(puzzles, engine=None, chunk_size=10000, max_branches=MAX_BRANCHES):
+    np = _np()
+
+    puzzles = np.asarray(puzzles, dtype=np.uint8).reshape(-1, 81)
+    grids = puzzles.copy()
+    status = np.zeros(len(grids), dtype=bool)
+
+    for start in range(0, len(grids), chunk_size):
+        chunk = grids[start:start + chunk_size]
+        consistent, candidates = _batch_propagate(chunk)
+        done = consistent & (chunk != 0).all(axis=1)
+
+        left = np.flatnonzero(consistent & ~done)
+        unsolved = chunk[left]
+        solved, given_up = _batch_search(unsolved, candidates[left], max_branches)
+        chunk[left[solved]] = unsolved[solved]
+        done[left[solved]] = True
+
+        for i in left[given_up]:
+            grid = chunk[i].reshape(9, 9).tolist()
+            if solve(grid, engine):
+                chunk[i] = np.ravel(grid)
+                done[i] = True
+
+        status[start:start + chunk_size] = done
+
+    grids[~status] = puzzles[~status]
+    return grids.reshape(-1, 9, 9), status
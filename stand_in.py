@@ -0,0 +1,143 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bulk_solve import format_grid
+from generator import generate
+
+LEVELS = (1, 2, 3, 4)
+
+
+# Page with the puzzle cells laid out as on the sudoku website, input ids fXY with the given digits as values
+def render_page(line, level=1):
+    rows = []
+    for r in range(9):
+        cells = []
+        for c in range(9):
+            cid = '%d%d' % (r, c)
+            if line[r * 9 + c] != '0':
+                cells.append('<TD CLASS=f0 ID=c{0}><INPUT CLASS=s0 SIZE=2 AUTOCOMPLETE=off NAME={0} ID=f{0} '
+                             'VALUE="{1}" READONLY></TD>'.format(cid, line[r * 9 + c]))
+            else:
+                cells.append('<TD CLASS=f0 ID=c{0}><INPUT CLASS=d0 SIZE=2 AUTOCOMPLETE=off NAME={0} ID=f{0} '
+                             'onBlur=j8(this)></TD>'.format(cid))
+        rows.append('<TR>\n' + '\n'.join(cells) + '\n</TR>')
+
+    return ('<HTML>\n<HEAD>\n<TITLE>Web Sudoku</TITLE>\n</HEAD>\n<BODY>\n<FORM NAME="board" METHOD=POST ACTION="/">\n'
+            '<INPUT TYPE=hidden NAME=level VALUE="{}">\n<TABLE ID="puzzle_grid" CELLSPACING=0 CELLPADDING=0 CLASS=t>\n'
+            '{}\n</TABLE>\n</FORM>\n</BODY>\n</HTML>\n'.format(level, '\n'.join(rows)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        site = self.server.site
+        try:
+            level = int(parse_qs(urlparse(self.path).query)['level'][0])
+            pool = site.pools[level]
+        except (KeyError, ValueError):
+            return self.reply(404, b'no such level')
+
+        if site.delay:
+            time.sleep(site.delay)
+
+        with site.lock:
+            site.requests += 1
+            failed = site.error_rng.random() < site.errors
+            if failed:
+                site.failures += 1
+            else:
+                line = pool[site.served[level] % len(pool)]
+                site.served[level] += 1
+
+        if failed:
+            return self.reply(503, b'service unavailable')
+        self.reply(200, render_page(line, level).encode('latin-1'), 'text/html; charset=ISO-8859-1')
+
+    def reply(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Local stand-in for the sudoku website, for trying the scraper and harvest.py without reaching the real one.
+# Every difficulty has a pool of generated puzzles served in turn, so puzzles repeat once the pool is used up,
+# and a fraction of the requests fail with 503 errors. The same seed gives the same puzzles and the same failures.
+class StandInSite:
+
+    def __init__(self, pool=40, errors=0.0, delay=0.0, seed=0, host='127.0.0.1', port=0, levels=LEVELS):
+        rng = random.Random(seed)
+        self.pools = {level: [format_grid(generate(level, rng, rated=False)) for i in range(pool)]
+                      for level in levels}
+
+        self.errors = errors
+        self.error_rng = random.Random(seed)
+        self.delay = delay
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.served = {level: 0 for level in levels}
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.site = self
+        self.thread = None
+
+    # Page url for get_puzzle and harvest.py, '{}' is replaced by the difficulty
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/?level={{}}'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stand-in', daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve generated puzzle pages in the layout of the sudoku website")
+    parser.add_argument('-p', '--port', type=int, default=8000, help="port to listen on")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--pool', type=int, default=40, help="puzzles of each difficulty before they repeat")
+    parser.add_argument('--errors', type=float, default=0.1, help="fraction of requests failing with 503")
+    parser.add_argument('--delay', type=float, default=0.1, help="seconds before each response")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the puzzles and failures")
+    args = parser.parse_args(argv)
+
+    site = StandInSite(args.pool, args.errors, args.delay, args.seed, args.host, args.port)
+    print("Serving puzzle pages at {}".format(site.url), file=sys.stderr)
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+from collections import namedtuple
+from itertools import chain, permutations, product
+from math import factorial
+
+from solver import shape_of
+
+# Most orientations of a puzzle tried when looking for its canonical form, puzzles with more orientations left
+# after refinement (very symmetric or nearly empty boards) are not given a canonical form
+LIMIT = 4096
+
+
+# Orientation of a puzzle relative to its canonical form: whether it is transposed, the rows and columns of the
+# puzzle in canonical order, and labels[d] the canonical digit of digit d (labels[0] is 0)
+class Transform(namedtuple('Transform', ['transpose', 'rows', 'cols', 'labels'])):
+    __slots__ = ()
+
+    # Cells of the grid in the canonical orientation and labels, row by row
+    def apply(self, grid):
+        labels = self.labels
+        if self.transpose:
+            return bytes(labels[grid[c][r]] for r in self.rows for c in self.cols)
+        return bytes(labels[grid[r][c]] for r in self.rows for c in self.cols)
+
+    # Writing cells in the canonical orientation and labels back into the grid in its own orientation
+    def restore(self, cells, grid):
+        digits = [0] * len(self.labels)
+        for d, label in enumerate(self.labels):
+            digits[label] = d
+
+        k = 0
+        for r in self.rows:
+            for c in self.cols:
+                if self.transpose:
+                    grid[c][r] = digits[cells[k]]
+                else:
+                    grid[r][c] = digits[cells[k]]
+                k += 1
+
+
+# Every order of the items that sorts them by key, largest first, with items of equal key in any order
+def _tied_orders(items, key):
+    return [tuple(chain.from_iterable(parts)) for parts in product(*(permutations(g) for g in _ties(items, key)))]
+
+
+# Items sorted by key, largest first, in groups of equal key
+def _ties(items, key):
+    groups = []
+    for item in sorted(items, key=key, reverse=True):
+        if groups and key(groups[-1][0]) == key(item):
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+def _tied_count(items, key):
+    count = 1
+    for group in _ties(items, key):
+        count *= factorial(len(group))
+    return count
+
+
+def _bands(colours, box):
+    bands = [range(b * box, (b + 1) * box) for b in range(box)]
+    band_colours = [sorted((colours[line] for line in band), reverse=True) for band in bands]
+    return bands, band_colours
+
+
+# Number of orders _line_orders gives, counted without building them
+def _line_order_count(colours, box):
+    bands, band_colours = _bands(colours, box)
+    count = _tied_count(range(box), band_colours.__getitem__)
+    for band in bands:
+        count *= _tied_count(band, colours.__getitem__)
+    return count
+
+
+# Orders of the rows (or columns) allowed by their colours: bands sorted by the colours of their rows and
+# rows sorted by colour inside every band, lines of equal colour in either order
+def _line_orders(colours, box):
+    bands, band_colours = _bands(colours, box)
+    inside = [_tied_orders(band, colours.__getitem__) for band in bands]
+
+    orders = []
+    for band_order in _tied_orders(range(box), band_colours.__getitem__):
+        for parts in product(*(inside[b] for b in band_order)):
+            orders.append(tuple(chain.from_iterable(parts)))
+    return orders
+
+
+# Colours of the rows and columns that every symmetry of the puzzle keeps: the digits of a line weighted by how
+# often each digit is given, refined once by the colours of the crossing lines
+def _colours(grid, n, weight):
+    cols = [[grid[r][c] for r in range(n)] for c in range(n)]
+    row0 = [tuple(sorted(weight[v] for v in row if v)) for row in grid]
+    col0 = [tuple(sorted(weight[v] for v in col if v)) for col in cols]
+
+    rows = [(row0[r], tuple(sorted((col0[c], weight[v]) for c, v in enumerate(grid[r]) if v))) for r in range(n)]
+    cols = [(col0[c], tuple(sorted((row0[r], weight[v]) for r, v in enumerate(cols[c]) if v))) for c in range(n)]
+    return rows, cols
+
+
+# Canonical form of a puzzle under the symmetries of sudoku: relabelling digits, transposing, and swapping bands,
+# stacks, rows inside a band and columns inside a stack. Equivalent puzzles have the same canonical form.
+# The form is the smallest of the puzzle's orientations, cells read row by row with digits numbered in order of
+# first appearance. Only orientations keeping rows and columns sorted by colour are compared, which leaves the
+# result the same for every equivalent puzzle.
+# Returns the canonical cells as bytes and the Transform of the puzzle, or None if more than limit orientations
+# would have to be compared. The orientations are counted before any is built, so sparse boards are given up on
+# quickly.
+def canonical_form(grid, limit=LIMIT):
+    n = len(grid)
+    box = shape_of(n).box
+    grid = [list(row) for row in grid]
+
+    weight = [0] * (n + 1)
+    for row in grid:
+        for v in row:
+            weight[v] += 1
+
+    rows, cols = _colours(grid, n, weight)
+
+    # Transposing swaps the colours of rows and columns, so the side with the larger colours goes first
+    # and both are tried when they are equal
+    transposed = [list(col) for col in zip(*grid)]
+    row_key, col_key = sorted(rows), sorted(cols)
+    sides = []
+    if row_key >= col_key:
+        sides.append((False, grid, rows, cols))
+    if col_key >= row_key:
+        sides.append((True, transposed, cols, rows))
+
+    total = 0
+    for transpose, m, row_colours, col_colours in sides:
+        total += _line_order_count(row_colours, box) * _line_order_count(col_colours, box)
+        if total > limit:
+            return None
+
+    candidates = [(transpose, m, _line_orders(row_colours, box), _line_orders(col_colours, box))
+                  for transpose, m, row_colours, col_colours in sides]
+
+    best = None
+    for transpose, m, row_orders, col_orders in candidates:
+        for col_order in col_orders:
+            permuted = [[row[c] for c in col_order] for row in m]
+            for row_order in row_orders:
+                labels = {0: 0}
+                key = bytes([labels.setdefault(v, len(labels)) for r in row_order for v in permuted[r]])
+                if best is None or key < best[0]:
+                    best = (key, transpose, row_order, col_order, labels)
+
+    key, transpose, row_order, col_order, labels = best
+
+    # Digits missing from the puzzle get the remaining labels in order, so the labels cover every digit
+    missing = iter(range(len(labels), n + 1))
+    table = bytes(labels[d] if d in labels else next(missing) for d in range(n + 1))
+    return key, Transform(transpose, row_order, col_order, table)
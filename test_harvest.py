@@ -0,0 +1,97 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import harvest
+from stand_in import StandInSite
+
+
+class HarvestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, 'level{}.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def lines(self, level):
+        with open(self.output.format(level)) as f:
+            return f.read().split()
+
+    def harvest(self, site, count, levels, **options):
+        options.setdefault('concurrency', 1)
+        options.setdefault('rate', 0)
+        options.setdefault('backoff', 0.01)
+        return harvest.harvest(count, levels, output=self.output, url=site.url, **options)
+
+    # Requests failing with 503 are retried until every wanted puzzle is written once
+    def test_failed_requests_are_retried(self):
+        with StandInSite(pool=20, errors=0.3, seed=1) as site:
+            stats = self.harvest(site, 5, (1, 2), retries=5)
+
+        self.assertGreater(site.failures, 0)
+        for level in (1, 2):
+            self.assertEqual(stats[level]['written'], 5)
+            self.assertEqual(stats[level]['failed'], 0)
+            lines = self.lines(level)
+            self.assertEqual(len(set(lines)), 5)
+            self.assertTrue(set(lines) <= set(site.pools[level]))
+
+    # Waits before the retries double, and a puzzle is given up on after the last one
+    def test_backoff(self):
+        with StandInSite(pool=1, errors=1.0, levels=(1,)) as site:
+            start = time.perf_counter()
+            stats = self.harvest(site, 1, (1,), retries=2, backoff=0.1)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(site.requests, 3)
+        self.assertEqual(stats[1]['failed'], 1)
+        self.assertEqual(self.lines(1), [])
+        self.assertGreaterEqual(elapsed, 0.1 + 0.2)
+
+    # Puzzles written by an earlier run are skipped, and a site that only repeats them is given up on
+    def test_duplicates_across_runs(self):
+        with StandInSite(pool=5, seed=2, levels=(1,)) as site:
+            stats = self.harvest(site, 3, (1,))
+        self.assertEqual(stats[1]['written'], 3)
+
+        # The same puzzles are served again from the start
+        with StandInSite(pool=5, seed=2, levels=(1,)) as site:
+            stats = self.harvest(site, 2, (1,))
+            self.assertEqual((stats[1]['written'], stats[1]['duplicates']), (2, 3))
+            self.assertEqual(sorted(self.lines(1)), sorted(site.pools[1]))
+
+            stats = self.harvest(site, 1, (1,))
+            self.assertEqual(stats[1], {'fetched': harvest.MAX_ATTEMPTS, 'written': 0,
+                                        'duplicates': harvest.MAX_ATTEMPTS, 'failed': 0})
+        self.assertEqual(len(self.lines(1)), 5)
+
+    # More workers than the default connection pool still reuse their connections instead of discarding them
+    def test_pool_sized_to_concurrency(self):
+        with StandInSite(pool=200, delay=0.05, seed=4, levels=(1,)) as site:
+            with self.assertNoLogs('urllib3.connectionpool', level='WARNING'):
+                stats = self.harvest(site, 48, (1,), concurrency=16)
+
+        self.assertEqual(stats[1]['written'], 48)
+
+    def test_main_with_url(self):
+        with StandInSite(pool=10, errors=0.2, seed=3) as site:
+            with contextlib.redirect_stderr(io.StringIO()) as err:
+                code = harvest.main(['-n', '4', '-l', '3', '-j', '4', '-r', '0', '--backoff', '0.01',
+                                     '--retries', '5', '--url', site.url, '-o', self.output])
+
+        self.assertEqual(code, 0)
+        self.assertIn("Difficulty 3: 4 written", err.getvalue())
+        lines = self.lines(3)
+        self.assertEqual(len(set(lines)), 4)
+        self.assertTrue(set(lines) <= set(site.pools[3]))
+        self.assertFalse(os.path.exists(self.output.format(1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import puzzle
+
+# Saved websudoku page and the puzzle on it
+PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'websudoku.html')
+EXPECTED = "003020600900305001001806400008102900700000008006708200002609500800203009005010300"
+
+
+def expected_board():
+    return [[int(EXPECTED[i * 9 + j]) for j in range(9)] for i in range(9)]
+
+
+# Serving the saved page for every path, remembering the paths asked for
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        with open(PAGE, 'rb') as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=ISO-8859-1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GetPuzzleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        self.server.paths = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/?level={}' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse_saved_page(self):
+        with open(PAGE, encoding='latin-1') as f:
+            html = f.read()
+        self.assertEqual(puzzle.parse_puzzle(html), expected_board())
+
+        # Split anywhere, even inside a tag
+        chunks = [html[i:i + 100] for i in range(0, len(html), 100)]
+        self.assertEqual(puzzle.parse_puzzle(chunks), expected_board())
+
+    def test_get_puzzle_from_local_server(self):
+        self.assertEqual(puzzle.get_puzzle(2, url=self.url), expected_board())
+        self.assertEqual(self.server.paths, ['/?level=2'])
+
+        self.assertEqual(puzzle.get_puzzle(3, url=self.url), expected_board())
+        self.assertEqual(self.server.paths, ['/?level=2', '/?level=3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
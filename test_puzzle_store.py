@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import bench
+from puzzle_store import PuzzleStore, write_store
+
+
+class PuzzleStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'puzzles.sds')
+        self.lines = bench.load_corpus('easy')[:5]
+        write_store(self.path, {1: self.lines})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get(self):
+        with PuzzleStore(self.path) as store:
+            self.assertEqual(store.count(1), 5)
+            self.assertEqual(store.count(4), 0)
+            self.assertEqual(store.get(1, 2), bench.parse_line(self.lines[2]))
+
+    # A record still in use keeps the map alive instead of making close() fail
+    def test_close_with_record_in_use(self):
+        store = PuzzleStore(self.path)
+        record = store.record(1, 0)
+        expected = bytes(record)
+
+        store.close()
+        self.assertEqual(bytes(record), expected)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
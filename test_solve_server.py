@@ -0,0 +1,38 @@
+import asyncio
+import unittest
+
+import bench
+from solve_server import SolveServer
+
+
+class SolveServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = SolveServer(workers=1, engine='backtrack', timeout=3.0).start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    # Easy puzzles batched behind one the backtracking engine can't finish are answered long before its timeout
+    async def test_slow_request_does_not_hold_up_its_batch(self):
+        slow = bench.load_corpus('pathological')[0]
+        # Easy puzzles backtracking solves in a few milliseconds
+        easy = [bench.load_corpus('easy')[k] for k in (0, 1, 3, 4, 5)]
+
+        pending = asyncio.create_task(self.server.submit({'id': 'slow', 'puzzle': slow}))
+        responses = await asyncio.gather(*(self.server.submit({'id': k, 'puzzle': p}) for k, p in enumerate(easy)))
+
+        # Every easy puzzle is answered while the slow one is still running
+        self.assertFalse(pending.done())
+        for response in responses:
+            self.assertTrue(response['ok'] and response['solved'], response)
+        self.assertEqual((await pending)['error'], 'timeout')
+
+    async def test_bad_request(self):
+        response = await self.server.submit({'id': 1, 'puzzle': '123'})
+        self.assertFalse(response['ok'])
+        self.assertEqual(response['id'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+
+import numpy as np
+
+import bench
+import generator
+import solver
+
+
+# Checking a batch answer: solved grids keep the givens and fill every unit with 1 - 9
+def assert_solution(test, puzzle, grid):
+    test.assertTrue(((puzzle == 0) | (puzzle == grid)).all())
+    for unit in solver._UNITS:
+        test.assertEqual(sorted(int(grid[x][y]) for x, y in unit), list(range(1, 10)))
+
+
+class SolveBatchTest(unittest.TestCase):
+
+    def check(self, puzzles, **options):
+        puzzles = np.array(puzzles, dtype=np.uint8).reshape(-1, 9, 9)
+        grids, status = solver.solve_batch(puzzles, **options)
+
+        for puzzle, grid, ok in zip(puzzles, grids, status):
+            self.assertEqual(bool(ok), solver.solve(puzzle.tolist()))
+            if ok:
+                assert_solution(self, puzzle, grid)
+            else:
+                self.assertTrue((grid == puzzle).all())
+        return status
+
+    def corpora(self):
+        return [bench.parse_line(line) for name in bench.CORPORA for line in bench.load_corpus(name)]
+
+    def test_corpora(self):
+        self.assertTrue(self.check(self.corpora()).all())
+
+    # Grids that split into more than one copy are left to solve(), and solved all the same
+    def test_fallback(self):
+        self.assertTrue(self.check(self.corpora(), max_branches=1).all())
+
+    def test_contradictory(self):
+        twice = [[0] * 9 for x in range(9)]
+        twice[0][0] = twice[0][5] = 5
+
+        # Consistent givens without a solution, only found out by searching
+        unsolvable = bench.parse_line('..9.7...5..21..9..1...28....7...5..1..851.....5....3.......3..68........21.....87')
+
+        status = self.check([twice, unsolvable, bench.parse_line(bench.load_corpus('easy')[0])])
+        self.assertEqual(status.tolist(), [False, False, True])
+
+    # Few givens leave many solutions, any of them is a valid answer
+    def test_multiple_solutions(self):
+        rng = random.Random(0)
+        puzzles = [[[0] * 9 for x in range(9)]]
+        for i in range(50):
+            grid = generator.random_solution(rng)
+            for cell in rng.sample(range(81), rng.randrange(50, 75)):
+                grid[cell // 9][cell % 9] = 0
+            puzzles.append(grid)
+
+        self.assertTrue(self.check(puzzles).all())
+        self.assertTrue(self.check(puzzles, max_branches=1).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import generator
+import solver
+import symmetry
+from solution_cache import SolutionCache
+
+
+# Grid with only the boxes on the diagonal filled, as random_solution starts from
+def diagonal_boxes(box, rng):
+    size = box * box
+    grid = [[0] * size for x in range(size)]
+    for b in range(box):
+        for k, n in enumerate(rng.sample(range(1, size + 1), size)):
+            grid[b * box + k // box][b * box + k % box] = n
+    return grid
+
+
+class SparseBoardTest(unittest.TestCase):
+
+    def sparse_grids(self, box):
+        size = box * box
+        one = [[0] * size for x in range(size)]
+        one[size // 2][1] = 1
+        return [[[0] * size for x in range(size)], one, diagonal_boxes(box, random.Random(box))]
+
+    # Boards with too many equal orientations are given up on without building them
+    def test_sparse_boards_are_given_up_quickly(self):
+        with mock.patch.object(symmetry, '_line_orders', side_effect=AssertionError("orientations built")):
+            for box in (4, 5):
+                for grid in self.sparse_grids(box):
+                    self.assertIsNone(symmetry.canonical_form(grid))
+
+    def test_solve_with_cache_on_sparse_boards(self):
+        solver.set_solution_cache(SolutionCache())
+        try:
+            for box in (4, 5):
+                grid = diagonal_boxes(box, random.Random(box))
+                self.assertTrue(solver.solve(grid))
+                self.assertTrue(all(all(row) for row in grid))
+                self.assertEqual(len(generator.generate(1, random.Random(0), box)), box * box)
+        finally:
+            solver.set_solution_cache(None)
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'solutions')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    # Solutions stored between syncs are written out when the cache is closed
+    def test_solutions_kept_across_runs(self):
+        with SolutionCache(path=self.path) as cache:
+            cache.put(b'a', b'solved a')
+            cache.put(b'b', b'')
+
+        with SolutionCache(path=self.path) as cache:
+            self.assertEqual((cache.get(b'a'), cache.get(b'b'), cache.get(b'c')), (b'solved a', b'', None))
+
+    # Once the file is full it is rewritten with only the most recently used solutions
+    def test_file_size_is_bounded(self):
+        keys = [str(i).encode() for i in range(25)]
+        with SolutionCache(size=4, path=self.path, disk_size=10) as cache:
+            for key in keys:
+                cache.put(key, key * 2)
+                self.assertLessEqual(cache._stored, 10)
+
+        with SolutionCache(size=4, path=self.path, disk_size=10) as cache:
+            self.assertLessEqual(cache._stored, 10)
+            for key in keys[-4:]:
+                self.assertEqual(cache.get(key), key * 2)
+
+
+class CanonicalFormTest(unittest.TestCase):
+
+    # Relabelling, swapping bands, rows, stacks and columns and transposing the puzzle
+    def shuffle(self, grid, box, rng):
+        size = box * box
+        bands = rng.sample(range(box), box)
+        stacks = rng.sample(range(box), box)
+        rows = [b * box + r for b in bands for r in rng.sample(range(box), box)]
+        cols = [s * box + c for s in stacks for c in rng.sample(range(box), box)]
+        labels = [0] + rng.sample(range(1, size + 1), size)
+
+        shuffled = [[labels[grid[r][c]] for c in cols] for r in rows]
+        if rng.random() < 0.5:
+            shuffled = [list(col) for col in zip(*shuffled)]
+        return shuffled
+
+    def test_equivalent_puzzles_share_a_form(self):
+        rng = random.Random(1)
+        for box in (3, 4):
+            puzzle = generator.generate(2, random.Random(box), box)
+            key, transform = symmetry.canonical_form(puzzle)
+            self.assertEqual(transform.apply(puzzle), key)
+
+            solution = [list(row) for row in puzzle]
+            self.assertTrue(solver.solve(solution))
+            cells = transform.apply(solution)
+
+            for i in range(3):
+                shuffled = self.shuffle(puzzle, box, rng)
+                found = symmetry.canonical_form(shuffled)
+                self.assertEqual(found[0], key)
+
+                restored = [list(row) for row in shuffled]
+                found[1].restore(cells, restored)
+                self.assertEqual(solver.count_solutions(restored, 1), 1)
+                self.assertTrue(all(all(row) for row in restored))
+                for x, row in enumerate(shuffled):
+                    for y, n in enumerate(row):
+                        if n:
+                            self.assertEqual(restored[x][y], n)
+
+
+if __name__ == "__main__":
+    unittest.main()
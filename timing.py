@@ -0,0 +1,15 @@
+# Helpers for reporting times, shared by the benchmark and the solve server
+
+
+# Value below which the given fraction of the sorted values fall, None when there are no values
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+# Seconds as milliseconds rounded to the microsecond, None stays None
+def to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)